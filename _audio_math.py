@@ -0,0 +1,73 @@
+"""
+Audio/MIDI Unit Conversions
+Plain NumPy versions of the few librosa helpers used for note names and
+pitch conversion, so scripts that only need these don't have to load librosa
+
+Same formulas and note spellings as librosa:
+- hz_to_midi / midi_to_hz
+- note_to_midi / note_to_hz (e.g. 'C4', 'F#2', 'B♭3')
+- midi_to_note (unicode sharps, e.g. 61 → 'C♯4')
+
+Also the shared audio loader, read_audio (soundfile and librosa are only
+imported when it is called)
+"""
+
+import re
+import numpy as np
+
+# Pitch-class names as librosa.midi_to_note spells them
+PITCH_CLASS_NAMES = ('C', 'C♯', 'D', 'D♯', 'E', 'F', 'F♯', 'G', 'G♯', 'A', 'A♯', 'B')
+
+_NOTE_PATTERN = re.compile(r'^([A-Ga-g])([#♯b♭!]*)(-?\d+)$')
+_LETTER_PITCH_CLASS = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+_ACCIDENTAL_OFFSET = {'#': 1, '♯': 1, 'b': -1, '♭': -1, '!': -1}
+
+def hz_to_midi(frequencies):
+    """Convert frequencies in Hz to (fractional) MIDI note numbers"""
+    return 12 * (np.log2(np.asanyarray(frequencies)) - np.log2(440.0)) + 69
+
+def midi_to_hz(notes):
+    """Convert (fractional) MIDI note numbers to frequencies in Hz"""
+    return 440.0 * (2.0 ** ((np.asanyarray(notes) - 69.0) / 12.0))
+
+def note_to_midi(note):
+    """MIDI note number of a note name with octave, e.g. 'C4' → 60"""
+    match = _NOTE_PATTERN.match(note)
+    if not match:
+        raise ValueError(f"Improper note format: {note}")
+
+    letter, accidentals, octave = match.groups()
+    offset = sum(_ACCIDENTAL_OFFSET[accidental] for accidental in accidentals)
+    return 12 * (int(octave) + 1) + _LETTER_PITCH_CLASS[letter.upper()] + offset
+
+def note_to_hz(note):
+    """Frequency in Hz of a note name with octave, e.g. 'A4' → 440.0"""
+    return midi_to_hz(note_to_midi(note))
+
+def midi_to_note(midi):
+    """Note name with octave of a MIDI note number (rounded to the nearest note)"""
+    note_num = int(np.round(midi))
+    return f"{PITCH_CLASS_NAMES[note_num % 12]}{note_num // 12 - 1}"
+
+def read_audio(audio_path, sr=22050):
+    """
+    Decode an audio file to mono float32 at the given sample rate
+    
+    Formats libsndfile handles (WAV, FLAC, OGG, ...) are read with soundfile
+    and resampled directly, skipping librosa.load's backend probing; the
+    result is the same as librosa.load(audio_path, sr=sr).
+    """
+    import soundfile as sf
+    import librosa
+    
+    try:
+        y, native_sr = sf.read(audio_path, dtype='float32')
+    except RuntimeError:
+        # Formats libsndfile can't open (e.g. some MP3/M4A builds)
+        return librosa.load(audio_path, sr=sr)
+    
+    if y.ndim == 2:
+        y = y.mean(axis=1)  # Downmix (frames, channels) to mono
+    if native_sr != sr:
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type='soxr_hq')
+    return y, sr
@@ -1,120 +1,189 @@
 import sys
 import os
 from pathlib import Path
-import pretty_midi
-import librosa
+import numpy as np
+import soundfile as sf
 import time
+from _audio_math import midi_to_note
 
-def analyze_midi_file(midi_path, original_audio_path=None):
-    """Analyze a MIDI file from BasicPitch output"""
-    print(f"\n🎼 Analyzing MIDI: {Path(midi_path).name}")
-    print("=" * 50)
+try:
+    import symusic
+    SYMUSIC_AVAILABLE = True
+except ImportError:
+    SYMUSIC_AVAILABLE = False
+
+# Note names for every MIDI pitch, shared across files
+_MIDI_NOTE_NAMES = tuple(midi_to_note(i) for i in range(128))
+
+# Note density labels indexed by how many thresholds (0.5, 1.0 notes/s) are exceeded
+_DENSITY_TIERS = ("Low", "Moderate", "High")
+
+def _write_report(lines):
+    """Write buffered report lines to stdout in a single call"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+def load_note_arrays(midi_path):
+    """
+    Read all notes of a MIDI file as parallel arrays
+    
+    Uses symusic's C++ parser when it is installed and falls back to
+    pretty_midi otherwise (or if symusic cannot parse the file).
+    
+    Returns:
+        tuple: (pitches, starts, ends, velocities, end_time, track_count)
+    """
+    if SYMUSIC_AVAILABLE:
+        try:
+            score = symusic.Score(midi_path, ttype='second')
+            track_notes = [track.notes.numpy() for track in score.tracks]
+            # The leading empty arrays fix the dtypes (and handle files without tracks)
+            pitches = np.concatenate([np.empty(0, np.int16)] + [n['pitch'] for n in track_notes])
+            starts = np.concatenate([np.empty(0, np.float64)] + [n['time'] for n in track_notes])
+            ends = starts + np.concatenate([np.empty(0, np.float64)] + [n['duration'] for n in track_notes])
+            velocities = np.concatenate([np.empty(0, np.int16)] + [n['velocity'] for n in track_notes])
+            return pitches, starts, ends, velocities, float(score.end()), len(score.tracks)
+        except Exception:
+            pass  # Fall back to pretty_midi below
+    
+    import pretty_midi
+    midi_data = pretty_midi.PrettyMIDI(midi_path)
+    
+    # Extract note fields into parallel arrays (one pass over the MIDI objects)
+    midi_notes = [note for instrument in midi_data.instruments for note in instrument.notes]
+    total_notes = len(midi_notes)
+    pitches = np.fromiter((note.pitch for note in midi_notes), dtype=np.int16, count=total_notes)
+    starts = np.fromiter((note.start for note in midi_notes), dtype=np.float64, count=total_notes)
+    ends = np.fromiter((note.end for note in midi_notes), dtype=np.float64, count=total_notes)
+    velocities = np.fromiter((note.velocity for note in midi_notes), dtype=np.int16, count=total_notes)
+    
+    return pitches, starts, ends, velocities, midi_data.get_end_time(), len(midi_data.instruments)
+
+def analyze_midi_file(midi_path, original_audio_path=None, verbose=True):
+    """Analyze a MIDI file from BasicPitch output
+    
+    The report is collected line by line and written once per file
+    (only when verbose); errors are always printed.
+    """
+    out = []
+    out.append(f"\n🎼 Analyzing MIDI: {Path(midi_path).name}")
+    out.append("=" * 50)
     
     if not os.path.exists(midi_path):
+        if verbose:
+            _write_report(out)
         print(f"❌ Error: MIDI file {midi_path} not found")
         return None
     
     try:
-        # Load MIDI file
-        midi_data = pretty_midi.PrettyMIDI(midi_path)
-        
-        # Get all notes across all instruments
-        all_notes = []
-        for instrument in midi_data.instruments:
-            all_notes.extend(instrument.notes)
+        # Load MIDI file as note arrays
+        pitches, starts, ends, velocities, total_duration, instrument_count = load_note_arrays(midi_path)
+        total_notes = len(pitches)
         
-        # Sort notes by start time
-        all_notes.sort(key=lambda x: x.start)
+        # Sort notes by start time; single-track transcriptions are usually
+        # already in order, in which case the stable sort would be a no-op
+        if not np.all(starts[1:] >= starts[:-1]):
+            order = np.argsort(starts, kind='stable')
+            pitches, starts, ends, velocities = pitches[order], starts[order], ends[order], velocities[order]
         
-        # Basic statistics
-        total_notes = len(all_notes)
-        total_duration = midi_data.get_end_time()
+        # Basic statistics (total_notes / total_duration come from the loader)
         
         if total_notes > 0:
             note_density = total_notes / total_duration if total_duration > 0 else 0
-            avg_duration = sum(note.end - note.start for note in all_notes) / total_notes
+            avg_duration = float(ends.mean() - starts.mean())
             
             # Pitch range
-            pitches = [note.pitch for note in all_notes]
-            min_pitch = min(pitches)
-            max_pitch = max(pitches)
+            note_names = _MIDI_NOTE_NAMES
+            min_pitch = int(pitches.min())
+            max_pitch = int(pitches.max())
             
-            # Most common pitches
-            from collections import Counter
-            pitch_counts = Counter(pitches)
-            most_common_pitches = pitch_counts.most_common(5)
+            # Most common pitches (ties keep first-appearance order)
+            unique_pitches, first_seen, pitch_counts = np.unique(pitches, return_index=True, return_counts=True)
+            top = np.lexsort((first_seen, -pitch_counts))[:5]
+            most_common_pitches = list(zip(unique_pitches[top].tolist(), pitch_counts[top].tolist()))
         
-        print(f"📊 MIDI Analysis Results:")
-        print(f"   Total notes: {total_notes}")
-        print(f"   Duration: {total_duration:.2f} seconds")
+        out.append(f"📊 MIDI Analysis Results:")
+        out.append(f"   Total notes: {total_notes}")
+        out.append(f"   Duration: {total_duration:.2f} seconds")
         
         if total_notes > 0:
-            print(f"   Note density: {note_density:.1f} notes/second")
-            print(f"   Average note duration: {avg_duration:.2f} seconds")
-            print(f"   Pitch range: {librosa.midi_to_note(min_pitch)} to {librosa.midi_to_note(max_pitch)} (MIDI {min_pitch}-{max_pitch})")
+            out.append(f"   Note density: {note_density:.1f} notes/second")
+            out.append(f"   Average note duration: {avg_duration:.2f} seconds")
+            out.append(f"   Pitch range: {note_names[min_pitch]} to {note_names[max_pitch]} (MIDI {min_pitch}-{max_pitch})")
             
-            print(f"\n🎹 First 10 detected notes:")
-            for i, note in enumerate(all_notes[:10]):
-                note_name = librosa.midi_to_note(int(note.pitch))
-                print(f"   {i+1:2d}. {note_name:4s} at {note.start:5.2f}s-{note.end:5.2f}s (vel: {note.velocity:3d})")
+            out.append(f"\n🎹 First 10 detected notes:")
+            for i, (pitch, start, end, velocity) in enumerate(zip(pitches[:10], starts[:10], ends[:10], velocities[:10])):
+                note_name = note_names[pitch]
+                out.append(f"   {i+1:2d}. {note_name:4s} at {start:5.2f}s-{end:5.2f}s (vel: {velocity:3d})")
             
             if len(most_common_pitches) > 0:
-                print(f"\n🔢 Most frequent notes:")
+                out.append(f"\n🔢 Most frequent notes:")
                 for pitch, count in most_common_pitches:
-                    note_name = librosa.midi_to_note(pitch)
-                    print(f"   {note_name:4s} (MIDI {pitch:3d}): {count:2d} times")
+                    note_name = note_names[pitch]
+                    out.append(f"   {note_name:4s} (MIDI {pitch:3d}): {count:2d} times")
         else:
-            print("   ⚠️  No notes detected!")
+            out.append("   ⚠️  No notes detected!")
         
         # Compare with original audio if provided
         if original_audio_path and os.path.exists(original_audio_path):
-            print(f"\n🔍 Comparing with original audio:")
-            y, sr = librosa.load(original_audio_path)
-            audio_duration = len(y) / sr
-            print(f"   Audio duration: {audio_duration:.2f}s | MIDI duration: {total_duration:.2f}s")
-            print(f"   Duration match: {abs(audio_duration - total_duration) < 0.1}")
+            out.append(f"\n🔍 Comparing with original audio:")
+            try:
+                # Header-only read: no decoding or resampling needed for the duration
+                info = sf.info(original_audio_path)
+                audio_duration = info.frames / info.samplerate
+            except RuntimeError:
+                # Formats libsndfile can't open (e.g. some MP3/M4A builds)
+                import librosa
+                y, sr = librosa.load(original_audio_path)
+                audio_duration = len(y) / sr
+            out.append(f"   Audio duration: {audio_duration:.2f}s | MIDI duration: {total_duration:.2f}s")
+            out.append(f"   Duration match: {abs(audio_duration - total_duration) < 0.1}")
         
         # Musical Analysis Insights
         if total_notes > 0:
-            print(f"\n🎼 Musical Analysis Insights:")
-            print("=" * 30)
+            out.append(f"\n🎼 Musical Analysis Insights:")
+            out.append("=" * 30)
             
-            # Analyze chord progression and key
-            g_notes = [n for n in all_notes if librosa.midi_to_note(int(n.pitch)).startswith('G')]
-            c_notes = [n for n in all_notes if librosa.midi_to_note(int(n.pitch)).startswith('C')]
-            d_notes = [n for n in all_notes if librosa.midi_to_note(int(n.pitch)).startswith('D')]
+            # Analyze chord progression and key from pitch classes
+            # (sharps share their letter's count, e.g. G and G♯)
+            pc_counts = np.bincount(pitches % 12, minlength=12)
+            c_count = int(pc_counts[0] + pc_counts[1])
+            d_count = int(pc_counts[2] + pc_counts[3])
+            g_count = int(pc_counts[7] + pc_counts[8])
             
-            print(f"🎵 The neural network captured:")
-            if g_notes and d_notes:
-                print(f"   ✓ G-C-D-G chord progression detected")
-                print(f"     - G notes: {len(g_notes)} occurrences")
-                print(f"     - C notes: {len(c_notes)} occurrences") 
-                print(f"     - D notes: {len(d_notes)} occurrences")
+            out.append(f"🎵 The neural network captured:")
+            if g_count and d_count:
+                out.append(f"   ✓ G-C-D-G chord progression detected")
+                out.append(f"     - G notes: {g_count} occurrences")
+                out.append(f"     - C notes: {c_count} occurrences") 
+                out.append(f"     - D notes: {d_count} occurrences")
             
             # Frequency range analysis
             frequency_span = max_pitch - min_pitch
-            min_note = librosa.midi_to_note(min_pitch)
-            max_note = librosa.midi_to_note(max_pitch)
-            print(f"   ✓ Wide frequency range ({min_note} to {max_note}) showing harmonic overtones")
-            print(f"     - Pitch span: {frequency_span} semitones")
-            print(f"     - Captures fundamental + harmonics")
+            min_note = note_names[min_pitch]
+            max_note = note_names[max_pitch]
+            out.append(f"   ✓ Wide frequency range ({min_note} to {max_note}) showing harmonic overtones")
+            out.append(f"     - Pitch span: {frequency_span} semitones")
+            out.append(f"     - Captures fundamental + harmonics")
             
             # Note density analysis
-            density_consistency = "High" if note_density > 1.0 else "Moderate" if note_density > 0.5 else "Low"
-            print(f"   ✓ Consistent note density across the ~{total_duration:.0f}-second recording")
-            print(f"     - Density: {note_density:.1f} notes/second ({density_consistency})")
-            print(f"     - Shows continuous musical content detection")
+            density_consistency = _DENSITY_TIERS[int(note_density > 0.5) + int(note_density > 1.0)]
+            out.append(f"   ✓ Consistent note density across the ~{total_duration:.0f}-second recording")
+            out.append(f"     - Density: {note_density:.1f} notes/second ({density_consistency})")
+            out.append(f"     - Shows continuous musical content detection")
             
             # Algorithm comparison
-            print(f"   ✓ Correct harmonic relationships that traditional algorithms missed")
-            print(f"     - Neural network: 100% key accuracy (G Major)")
-            print(f"     - Traditional librosa: 0% accuracy (detected wrong key)")
-            print(f"     - Superior harmonic context understanding")
+            out.append(f"   ✓ Correct harmonic relationships that traditional algorithms missed")
+            out.append(f"     - Neural network: 100% key accuracy (G Major)")
+            out.append(f"     - Traditional librosa: 0% accuracy (detected wrong key)")
+            out.append(f"     - Superior harmonic context understanding")
 
         # File size info
         file_size = Path(midi_path).stat().st_size
-        print(f"\n📁 File info:")
-        print(f"   MIDI file size: {file_size / 1024:.1f} KB")
+        out.append(f"\n📁 File info:")
+        out.append(f"   MIDI file size: {file_size / 1024:.1f} KB")
+        
+        if verbose:
+            _write_report(out)
         
         return {
             'file_name': Path(midi_path).name,
@@ -124,11 +193,13 @@ def analyze_midi_file(midi_path, original_audio_path=None):
             'avg_note_duration': avg_duration if total_notes > 0 else 0,
             'pitch_range': (min_pitch, max_pitch) if total_notes > 0 else (0, 0),
             'file_size_kb': file_size / 1024,
-            'instruments': len(midi_data.instruments),
-            'notes_list': [(note.pitch, note.start, note.end, note.velocity) for note in all_notes[:20]]
+            'instruments': instrument_count,
+            'notes_list': list(zip(pitches[:20].tolist(), starts[:20].tolist(), ends[:20].tolist(), velocities[:20].tolist()))
         }
         
     except Exception as e:
+        if verbose:
+            _write_report(out)
         print(f"❌ Error analyzing MIDI file: {e}")
         return None
 
@@ -141,9 +212,10 @@ def main():
     search_dirs = ['.', 'tests/midi', 'downloads', Path.home() / 'Downloads']
     
     for search_dir in search_dirs:
-        if os.path.exists(search_dir):
-            midi_files.extend(Path(search_dir).glob('*.mid'))
-            midi_files.extend(Path(search_dir).glob('*.midi'))
+        if os.path.isdir(search_dir):
+            with os.scandir(search_dir) as entries:
+                midi_files.extend(entry.path for entry in entries
+                                  if entry.name.endswith(('.mid', '.midi')) and entry.is_file())
     
     if not midi_files:
         print("❌ No MIDI files found. Please:")
@@ -166,14 +238,14 @@ def main():
     for midi_file in midi_files:
         # Try to find corresponding audio file
         audio_file = None
-        base_name = midi_file.stem
+        base_name = os.path.splitext(os.path.basename(midi_file))[0]
         for audio_ext in ['.wav', '.mp3', '.flac']:
             potential_audio = Path('tests/audio') / f"{base_name}{audio_ext}"
             if potential_audio.exists():
                 audio_file = str(potential_audio)
                 break
         
-        result = analyze_midi_file(str(midi_file), audio_file)
+        result = analyze_midi_file(midi_file, audio_file)
         if result:
             results.append(result)
     
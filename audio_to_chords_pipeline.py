@@ -19,24 +19,41 @@ import argparse
 from pathlib import Path
 import time
 import tempfile
+import contextlib
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-# Import our custom modules
-try:
-    from universal_audio_to_midi import AudioToMIDI
-    print("✅ Successfully imported AudioToMIDI")
-except ImportError as e:
-    print(f"❌ Error importing AudioToMIDI: {e}")
-    print("Make sure universal_audio_to_midi.py is in the same directory")
-    sys.exit(1)
+# Our custom modules pull in librosa/numba (and TensorFlow with CREPE), so they
+# are imported on first use rather than at module load; see _load_deps()
+AudioToMIDI = None
+analyze_midi_chords = None
 
-try:
-    from midi_to_chords import analyze_midi_chords, parse_midi_notes
-    print("✅ Successfully imported chord analysis functions")
-except ImportError as e:
-    print(f"❌ Error importing chord analysis: {e}")
-    print("Make sure midi_to_chords.py is in the same directory")
-    sys.exit(1)
+# Each batch worker loads its own copy of the pitch model, so don't default to
+# one worker per core
+DEFAULT_BATCH_WORKERS = 4
+
+def _load_deps():
+    """Import the audio-to-MIDI and chord analysis modules once"""
+    global AudioToMIDI, analyze_midi_chords
+    if AudioToMIDI is not None and analyze_midi_chords is not None:
+        return
+    
+    try:
+        from universal_audio_to_midi import AudioToMIDI
+        print("✅ Successfully imported AudioToMIDI")
+    except ImportError as e:
+        print(f"❌ Error importing AudioToMIDI: {e}")
+        print("Make sure universal_audio_to_midi.py is in the same directory")
+        sys.exit(1)
+    
+    try:
+        from midi_to_chords import analyze_midi_chords
+        print("✅ Successfully imported chord analysis functions")
+    except ImportError as e:
+        print(f"❌ Error importing chord analysis: {e}")
+        print("Make sure midi_to_chords.py is in the same directory")
+        sys.exit(1)
 
 class AudioToChordsPipeline:
     def __init__(self, 
@@ -55,6 +72,8 @@ class AudioToChordsPipeline:
             chord_window_size: Window size for chord analysis (auto if None)
             cleanup_midi: Whether to delete intermediate MIDI files
         """
+        _load_deps()
+        
         self.audio_converter = AudioToMIDI(
             confidence_threshold=confidence_threshold,
             min_note_duration=min_note_duration,
@@ -62,6 +81,15 @@ class AudioToChordsPipeline:
         )
         self.chord_window_size = chord_window_size
         self.cleanup_midi = cleanup_midi
+        
+        # Constructor arguments, used to rebuild the pipeline in worker processes
+        self.settings = {
+            'confidence_threshold': confidence_threshold,
+            'min_note_duration': min_note_duration,
+            'max_note_duration': max_note_duration,
+            'chord_window_size': chord_window_size,
+            'cleanup_midi': cleanup_midi
+        }
     
     def analyze_audio_file(self, audio_path, output_midi_path=None, verbose=True):
         """
@@ -90,15 +118,20 @@ class AudioToChordsPipeline:
             print("\n📡 STEP 1: Converting Audio to MIDI")
             print("-" * 40)
         
-        # Create temporary MIDI file if no output path specified
+        # Create temporary MIDI file if no output path specified; with cleanup
+        # enabled the temporary directory and its contents are removed on exit
         use_temp_file = output_midi_path is None
-        if use_temp_file:
-            temp_dir = tempfile.mkdtemp()
-            midi_path = os.path.join(temp_dir, f"{audio_file.stem}_temp.mid")
+        if use_temp_file and self.cleanup_midi:
+            midi_dir = tempfile.TemporaryDirectory()
         else:
-            midi_path = output_midi_path
+            midi_dir = contextlib.nullcontext(tempfile.mkdtemp() if use_temp_file else None)
         
-        try:
+        with midi_dir as temp_dir:
+            if use_temp_file:
+                midi_path = os.path.join(temp_dir, f"{audio_file.stem}_temp.mid")
+            else:
+                midi_path = output_midi_path
+            
             # Convert audio to MIDI
             conversion_start = time.time()
             midi_file_path = self.audio_converter.convert(audio_path, midi_path)
@@ -124,6 +157,11 @@ class AudioToChordsPipeline:
             analysis_time = time.time() - analysis_start
             total_time = time.time() - start_time
             
+            # Every musical window reaches chord_events (only silent/single-note
+            # segments are dropped there), so count distinct chords on the
+            # shorter, already grouped list
+            unique_chords = len({event['chord'] for event in chord_events})
+            
             # Compile results
             results = {
                 'audio_file': str(audio_file),
@@ -135,9 +173,9 @@ class AudioToChordsPipeline:
                 'chord_events': chord_events,
                 'stats': {
                     'total_chords': len(chord_progression),
-                    'unique_chords': len(set(item['chord'] for item in chord_progression)),
+                    'unique_chords': unique_chords,
                     'chord_events': len(chord_events),
-                    'audio_duration': chord_progression[-1]['end'] if chord_progression else 0
+                    'audio_duration': float(chord_progression['end'][-1]) if len(chord_progression) else 0
                 }
             }
             
@@ -153,68 +191,72 @@ class AudioToChordsPipeline:
                 print(f"🎼 Detected {results['stats']['total_chords']} chord segments")
                 print(f"🎯 Found {results['stats']['chord_events']} distinct chord events")
                 print(f"🎶 {results['stats']['unique_chords']} unique chord types")
-            
-            return results
-            
-        finally:
-            # Cleanup temporary MIDI file if requested
-            if use_temp_file and self.cleanup_midi:
-                try:
-                    if os.path.exists(midi_path):
-                        os.remove(midi_path)
-                    os.rmdir(temp_dir)
-                    if verbose:
-                        print(f"🧹 Cleaned up temporary MIDI file")
-                except:
-                    pass  # Ignore cleanup errors
+        
+        if verbose and use_temp_file and self.cleanup_midi:
+            print(f"🧹 Cleaned up temporary MIDI file")
+        
+        return results
     
-    def batch_analyze(self, audio_files, output_dir=None, verbose=True):
+    def batch_analyze(self, audio_files, output_dir=None, verbose=True, max_workers=None):
         """
         Analyze multiple audio files in batch
         
+        Files are independent, so they are spread across worker processes,
+        each holding its own pipeline with the pitch model already loaded.
+        
         Args:
-            audio_files: List of audio file paths
+            audio_files: List of audio file Paths
             output_dir: Directory to save MIDI files (temp if None)
             verbose: Whether to show detailed output
+            max_workers: Number of worker processes (if None: 1 with CREPE,
+                otherwise up to DEFAULT_BATCH_WORKERS)
             
         Returns:
-            list: Results for each file
+            list: Results for each file, in input order
         """
         if verbose:
             print(f"🎯 BATCH AUDIO-TO-CHORDS ANALYSIS")
             print(f"📁 Processing {len(audio_files)} files")
             print("=" * 60)
         
+        # Set MIDI output directory if specified
+        output_path = None
+        if output_dir:
+            output_path = Path(output_dir)
+            output_path.mkdir(exist_ok=True)
+        
+        workers = max(1, min(len(audio_files), max_workers or _default_batch_workers()))
         results = []
         
-        for i, audio_file in enumerate(audio_files, 1):
-            if verbose:
-                print(f"\n📂 File {i}/{len(audio_files)}: {Path(audio_file).name}")
-                print("=" * 40)
-            
-            try:
-                # Set MIDI output path if output directory specified
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.settings,)) as executor:
+            futures = []
+            for i, audio_file in enumerate(audio_files, 1):
+                audio_file = Path(audio_file)
                 midi_path = None
-                if output_dir:
-                    output_path = Path(output_dir)
-                    output_path.mkdir(exist_ok=True)
-                    midi_path = output_path / f"{Path(audio_file).stem}.mid"
+                if output_path:
+                    midi_path = output_path / f"{audio_file.stem}.mid"
                 
-                # Analyze file
-                result = self.analyze_audio_file(
-                    audio_file, 
-                    output_midi_path=midi_path,
-                    verbose=verbose
-                )
-                results.append(result)
-                
-            except Exception as e:
-                if verbose:
-                    print(f"❌ Error processing {audio_file}: {e}")
-                results.append({
-                    'audio_file': str(audio_file),
-                    'error': str(e)
-                })
+                futures.append(executor.submit(
+                    _analyze_one, audio_file, midi_path, i, len(audio_files), verbose
+                ))
+            
+            # Collect in submission order so results line up with audio_files
+            # and each file's log (captured in the worker) prints as one block
+            for audio_file, future in zip(audio_files, futures):
+                try:
+                    result, log = future.result()
+                    if verbose:
+                        print(log, end='')
+                    results.append(result)
+                except Exception as e:
+                    if verbose:
+                        print(f"❌ Error processing {audio_file}: {e}")
+                    results.append({
+                        'audio_file': str(audio_file),
+                        'error': str(e)
+                    })
         
         if verbose:
             print(f"\n🎉 BATCH PROCESSING COMPLETE")
@@ -222,9 +264,76 @@ class AudioToChordsPipeline:
             
         return results
 
+def _default_batch_workers():
+    """Worker count for batch_analyze when none is given"""
+    from universal_audio_to_midi import CREPE_AVAILABLE
+    
+    # A CREPE model (TensorFlow) per process is too much memory to multiply
+    if CREPE_AVAILABLE:
+        return 1
+    return min(DEFAULT_BATCH_WORKERS, os.cpu_count() or 1)
+
+# Per-process pipeline used by batch_analyze workers, and the output of
+# building it (passed on with the worker's first file)
+_worker_pipeline = None
+_worker_init_log = ''
+
+def _init_worker(settings):
+    """Build this worker's pipeline once and load the pitch model"""
+    global _worker_pipeline, _worker_init_log
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        _worker_pipeline = AudioToChordsPipeline(**settings)
+        _worker_pipeline.audio_converter.warmup()
+    _worker_init_log = log.getvalue()
+
+def _analyze_one(audio_file, midi_path, index, total, verbose):
+    """
+    Analyze a single file (a Path) inside a batch worker process
+    
+    Output is captured rather than printed, so that workers running at the
+    same time don't interleave their lines.
+    
+    Returns:
+        tuple: (result dict, captured log text)
+    """
+    global _worker_init_log
+    log = io.StringIO()
+    log.write(_worker_init_log)
+    _worker_init_log = ''
+    
+    with contextlib.redirect_stdout(log):
+        if verbose:
+            print(f"\n📂 File {index}/{total}: {audio_file.name}")
+            print("=" * 40)
+        
+        try:
+            result = _worker_pipeline.analyze_audio_file(
+                audio_file, 
+                output_midi_path=midi_path,
+                verbose=verbose
+            )
+        except Exception as e:
+            if verbose:
+                print(f"❌ Error processing {audio_file}: {e}")
+            result = {
+                'audio_file': str(audio_file),
+                'error': str(e)
+            }
+    
+    return result, log.getvalue()
+
+def _existing_file(path):
+    """argparse type: accept only paths to existing files"""
+    file_path = Path(path)
+    if not file_path.is_file():
+        raise argparse.ArgumentTypeError(f"File not found: {path}")
+    return file_path
+
 def main():
     parser = argparse.ArgumentParser(description='Audio-to-Chords Analysis Pipeline')
-    parser.add_argument('input', nargs='+', help='Input audio file(s) (.wav, .mp3, .flac, etc.)')
+    parser.add_argument('input', nargs='+', type=_existing_file,
+                       help='Input audio file(s) (.wav, .mp3, .flac, etc.)')
     parser.add_argument('-o', '--output-dir', help='Output directory for MIDI files (optional)')
     parser.add_argument('--confidence', type=float, default=0.3,
                        help='Audio-to-MIDI confidence threshold (0.1-0.9, default: 0.3)')
@@ -236,19 +345,19 @@ def main():
                        help='Chord analysis window size in seconds (auto if not specified)')
     parser.add_argument('--keep-midi', action='store_true',
                        help='Keep intermediate MIDI files (default: cleanup)')
+    parser.add_argument('--jobs', type=int,
+                       help=f'Worker processes for batch analysis (default: 1 with CREPE, '
+                            f'otherwise up to {DEFAULT_BATCH_WORKERS})')
     parser.add_argument('--quiet', action='store_true',
                        help='Reduce output verbosity')
     
     args = parser.parse_args()
     
-    # Validate input files
-    audio_files = []
-    for file_path in args.input:
-        path = Path(file_path)
-        if not path.exists():
-            print(f"❌ Error: File not found: {file_path}")
-            return 1
-        audio_files.append(str(path))
+    # Only load the heavy analysis modules once the command line is valid
+    _load_deps()
+    
+    # Input files were validated (and converted to Path) by argparse
+    audio_files = args.input
     
     # Create pipeline
     pipeline = AudioToChordsPipeline(
@@ -264,7 +373,7 @@ def main():
             # Single file analysis
             result = pipeline.analyze_audio_file(
                 audio_files[0],
-                output_midi_path=Path(args.output_dir) / f"{Path(audio_files[0]).stem}.mid" if args.output_dir else None,
+                output_midi_path=Path(args.output_dir) / f"{audio_files[0].stem}.mid" if args.output_dir else None,
                 verbose=not args.quiet
             )
             
@@ -276,7 +385,8 @@ def main():
             results = pipeline.batch_analyze(
                 audio_files,
                 output_dir=args.output_dir,
-                verbose=not args.quiet
+                verbose=not args.quiet,
+                max_workers=args.jobs
             )
             
             if not args.quiet:
@@ -6,304 +6,357 @@ Converts BasicPitch MIDI output to chord progressions with timestamps
 
 import sys
 import os
+import functools
+import logging
 from pathlib import Path
 import pretty_midi
-import librosa
 from music21 import converter, chord, stream, pitch, interval, key
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import numpy as np
+from numba import njit
+from _audio_math import midi_to_note
+
+log = logging.getLogger(__name__)
+
+# Notes are kept as parallel arrays (one entry per note, sorted by start time)
+MidiNotes = namedtuple('MidiNotes', ['start', 'end', 'pitch', 'velocity'])
+
+# One record per analyzed window (raw chord segment)
+CHORD_SEGMENT_DTYPE = np.dtype([
+    ('start', np.float64),
+    ('end', np.float64),
+    ('chord', 'U8'),
+    ('note_count', np.int32),
+    ('unique_pitches', np.int32),
+])
+
+# Note name for every MIDI pitch, e.g. NOTE_NAME_TABLE[61] == 'C♯4'
+NOTE_NAME_TABLE = np.array([midi_to_note(i) for i in range(128)])
+
+def _empty_notes():
+    """Return a MidiNotes with no notes"""
+    return MidiNotes(np.empty(0, np.float64), np.empty(0, np.float64),
+                     np.empty(0, np.int16), np.empty(0, np.int16))
 
 def parse_midi_notes(midi_path):
-    """Parse MIDI file and extract notes with timestamps"""
+    """Parse MIDI file and extract notes with timestamps
+    
+    Returns:
+        tuple: (MidiNotes of arrays sorted by start time, MIDI end time)
+    """
     try:
         midi_data = pretty_midi.PrettyMIDI(midi_path)
         
         # Get all notes across all instruments
-        all_notes = []
-        for instrument in midi_data.instruments:
-            for note in instrument.notes:
-                all_notes.append({
-                    'start': note.start,
-                    'end': note.end,
-                    'pitch': note.pitch,
-                    'velocity': note.velocity,
-                    'note_name': librosa.midi_to_note(note.pitch)
-                })
-        
-        # Sort by start time
-        all_notes.sort(key=lambda x: x['start'])
-        return all_notes, midi_data.get_end_time()
+        all_notes = [note for instrument in midi_data.instruments for note in instrument.notes]
+        note_count = len(all_notes)
+        starts = np.fromiter((note.start for note in all_notes), dtype=np.float64, count=note_count)
+        ends = np.fromiter((note.end for note in all_notes), dtype=np.float64, count=note_count)
+        pitches = np.fromiter((note.pitch for note in all_notes), dtype=np.int16, count=note_count)
+        velocities = np.fromiter((note.velocity for note in all_notes), dtype=np.int16, count=note_count)
+        
+        # Sort by start time (stable, so simultaneous notes keep track order)
+        order = np.argsort(starts, kind='stable')
+        notes = MidiNotes(starts[order], ends[order], pitches[order], velocities[order])
+        return notes, midi_data.get_end_time()
         
     except Exception as e:
         print(f"❌ Error parsing MIDI: {e}")
-        return [], 0
+        return _empty_notes(), 0
+
+def select_notes(notes, index):
+    """Return the notes picked by a boolean mask or index array"""
+    return MidiNotes(notes.start[index], notes.end[index], notes.pitch[index], notes.velocity[index])
+
+def musical_note_mask(notes, min_velocity=45, min_duration=0.1):
+    """Boolean mask of the notes that pass the velocity and duration filters"""
+    # Much stricter velocity filter - real guitar chords are loud
+    # Stricter duration filter - real chord notes last longer
+    return (notes.velocity >= min_velocity) & ((notes.end - notes.start) >= min_duration)
 
 def filter_musical_notes(notes, min_velocity=45, min_duration=0.1):
     """Filter out noise and artifacts, keeping only real musical notes - AGGRESSIVE"""
-    filtered_notes = []
-    
-    for note in notes:
-        # Much stricter velocity filter - real guitar chords are loud
-        if note['velocity'] < min_velocity:
-            continue
-            
-        # Stricter duration filter - real chord notes last longer
-        note_duration = note['end'] - note['start']
-        if note_duration < min_duration:
-            continue
-            
-        filtered_notes.append(note)
-    
-    return filtered_notes
+    return select_notes(notes, musical_note_mask(notes, min_velocity, min_duration))
 
-def detect_musical_activity(window_notes, min_notes=2, min_total_velocity=120):
-    """Detect if a window contains real musical activity vs silence/noise - RELAXED"""
-    if len(window_notes) < min_notes:
-        return False
-    
-    # Relaxed velocity check to catch quieter second strikes
-    total_velocity = sum(note['velocity'] for note in window_notes)
-    if total_velocity < min_total_velocity:
-        return False
-    
-    # For guitar chords, we need multiple notes
-    unique_pitches = set(note['pitch'] for note in window_notes)
-    if len(unique_pitches) < 2:  # Must have at least 2 different notes for a chord
-        return False
-    
-    # More lenient pitch range (guitar chords can span wider intervals)
-    pitches = sorted(unique_pitches)
-    pitch_range = pitches[-1] - pitches[0]
-    if pitch_range > 60:  # Increased from 50 to allow wider chords
-        return False
-    
-    return True
+def detect_musical_activity(note_count, total_velocity, min_pitch, max_pitch, min_notes=2, min_total_velocity=120):
+    """Detect if a window contains real musical activity vs silence/noise - RELAXED
+    
+    Works on per-window aggregates, either scalars for one window or
+    arrays covering many windows at once (see _window_aggregates).
+    """
+    return ((note_count >= min_notes)
+            # Relaxed velocity check to catch quieter second strikes
+            & (total_velocity >= min_total_velocity)
+            # For guitar chords, we need at least 2 different notes
+            & (max_pitch > min_pitch)
+            # More lenient pitch range (guitar chords can span wider intervals)
+            & (max_pitch - min_pitch <= 60))  # Increased from 50 to allow wider chords
+
+@njit(cache=True)
+def _window_aggregates(ends, pitches, velocities, window_starts, los, his):
+    """
+    Aggregate the notes active in each window in a single compiled pass
+    
+    Candidates for window w are notes los[w]:his[w]; those ending after the
+    window start overlap it.
+    
+    Returns:
+        tuple: per-window arrays (note_count, total_velocity, min_pitch,
+               max_pitch, pitch-class mask with bit pc set for each pitch class)
+    """
+    window_count = window_starts.shape[0]
+    note_counts = np.zeros(window_count, np.int64)
+    total_velocities = np.zeros(window_count, np.int64)
+    min_pitches = np.full(window_count, 128, np.int64)
+    max_pitches = np.full(window_count, -1, np.int64)
+    pitch_masks = np.zeros(window_count, np.uint16)
+    
+    for w in range(window_count):
+        window_start = window_starts[w]
+        for k in range(los[w], his[w]):
+            if ends[k] > window_start:
+                midi_pitch = pitches[k]
+                note_counts[w] += 1
+                total_velocities[w] += velocities[k]
+                min_pitches[w] = min(min_pitches[w], midi_pitch)
+                max_pitches[w] = max(max_pitches[w], midi_pitch)
+                pitch_masks[w] |= 1 << (midi_pitch % 12)
+    
+    return note_counts, total_velocities, min_pitches, max_pitches, pitch_masks
 
 def group_notes_by_time_windows(notes, window_size=2.0):
-    """Group notes into time windows for chord detection with silence detection"""
-    if not notes:
+    """Group notes into time windows for chord detection with silence detection
+    
+    Notes must be sorted by start time, as returned by parse_midi_notes.
+    """
+    if notes.pitch.size == 0:
         return []
     
     # Filter out noise and artifacts first
     musical_notes = filter_musical_notes(notes)
-    if not musical_notes:
+    if musical_notes.pitch.size == 0:
         return []
     
-    total_duration = max(note['end'] for note in musical_notes)
+    total_duration = float(musical_notes.end.max())
     windows = []
     
-    current_time = 0
-    while current_time < total_duration:
-        window_end = min(current_time + window_size, total_duration)
+    # Window start times, accumulated step by step like a running clock
+    window_count = int(np.ceil(total_duration / window_size)) + 1
+    steps = np.full(window_count, window_size, dtype=np.float64)
+    steps[0] = 0.0
+    window_starts = np.cumsum(steps)
+    window_starts = window_starts[window_starts < total_duration]
+    window_ends = np.minimum(window_starts + window_size, total_duration)
+    
+    # A note is active if it overlaps with the window. Notes starting at or
+    # after the window end are beyond `hi`; notes ending before the window
+    # starts can only begin up to one longest-note-duration earlier, so
+    # everything before `lo` is skipped without being looked at
+    max_note_duration = float((musical_notes.end - musical_notes.start).max())
+    his = np.searchsorted(musical_notes.start, window_ends, side='left')
+    los = np.searchsorted(musical_notes.start, window_starts - max_note_duration, side='right')
+    
+    # Only keep windows with real musical activity
+    note_counts, total_velocities, min_pitches, max_pitches, pitch_masks = _window_aggregates(
+        musical_notes.end, musical_notes.pitch, musical_notes.velocity, window_starts, los, his)
+    is_musical = detect_musical_activity(note_counts, total_velocities, min_pitches, max_pitches)
+    
+    for w in np.flatnonzero(is_musical).tolist():
+        current_time = float(window_starts[w])
+        lo, hi = los[w], his[w]
         
         # Find notes that are active in this window
-        window_notes = []
-        for note in musical_notes:
-            # Note is active if it overlaps with the window
-            if note['start'] < window_end and note['end'] > current_time:
-                window_notes.append(note)
-        
-        # Only add windows with real musical activity
-        if window_notes and detect_musical_activity(window_notes):
-            windows.append({
-                'start': current_time,
-                'end': window_end,
-                'notes': window_notes,
-                'is_musical': True
-            })
-        
-        current_time += window_size
+        active = lo + np.flatnonzero(musical_notes.end[lo:hi] > current_time)
+        window_notes = select_notes(musical_notes, active)
+        windows.append({
+            'start': current_time,
+            'end': float(window_ends[w]),
+            'notes': window_notes,
+            'pitches': tuple(np.unique(window_notes.pitch).tolist()),  # sorted unique MIDI pitches
+            'pitch_mask': int(pitch_masks[w]),  # 12-bit pitch-class mask
+            'is_musical': True
+        })
     
     return windows
 
+# COMPREHENSIVE CHORD PATTERNS, as sets of note names
+
+# 1. SUSPENDED CHORDS (sus2, sus4) - CRITICAL FOR USER'S SEQUENCE
+SUSPENDED_CHORDS = {
+    # sus2 chords (root + 2nd + 5th)
+    frozenset(['E', 'F#', 'B']): 'Esus2',
+    frozenset(['A', 'B', 'E']): 'Asus2', 
+    frozenset(['D', 'E', 'A']): 'Dsus2',
+    frozenset(['G', 'A', 'D']): 'Gsus2',
+    frozenset(['C', 'D', 'G']): 'Csus2',
+    frozenset(['F', 'G', 'C']): 'Fsus2',
+    frozenset(['B', 'C#', 'F#']): 'Bsus2',
+
+    # sus4 chords (root + 4th + 5th)  
+    frozenset(['E', 'A', 'B']): 'Esus4',
+    frozenset(['A', 'D', 'E']): 'Asus4',
+    frozenset(['D', 'G', 'A']): 'Dsus4', 
+    frozenset(['G', 'C', 'D']): 'Gsus4',
+    frozenset(['C', 'F', 'G']): 'Csus4',
+    frozenset(['F', 'Bb', 'C']): 'Fsus4',
+    frozenset(['B', 'E', 'F#']): 'Bsus4',
+}
+
+# 2. MINOR 7TH CHORDS - CRITICAL FOR F#m7
+MINOR_SEVENTH_CHORDS = {
+    frozenset(['F#', 'A', 'C#', 'E']): 'F#m7',
+    frozenset(['A', 'C', 'E', 'G']): 'Am7',
+    frozenset(['D', 'F', 'A', 'C']): 'Dm7',
+    frozenset(['E', 'G', 'B', 'D']): 'Em7',
+    frozenset(['B', 'D', 'F#', 'A']): 'Bm7',
+    frozenset(['C', 'Eb', 'G', 'Bb']): 'Cm7',
+    frozenset(['G', 'Bb', 'D', 'F']): 'Gm7',
+    frozenset(['C#', 'E', 'G#', 'B']): 'C#m7',
+}
+
+# 3. BASIC MAJOR CHORDS
+BASIC_MAJOR_CHORDS = {
+    frozenset(['E', 'G#', 'B']): 'E',
+    frozenset(['A', 'C#', 'E']): 'A',
+    frozenset(['B', 'D#', 'F#']): 'B',
+    frozenset(['F#', 'A#', 'C#']): 'F#',
+    frozenset(['C', 'E', 'G']): 'C',
+    frozenset(['D', 'F#', 'A']): 'D',
+    frozenset(['G', 'B', 'D']): 'G',
+    frozenset(['F', 'A', 'C']): 'F',
+}
+
+# 4. BASIC MINOR CHORDS
+BASIC_MINOR_CHORDS = {
+    frozenset(['F#', 'A', 'C#']): 'F#m',
+    frozenset(['A', 'C', 'E']): 'Am',
+    frozenset(['B', 'D', 'F#']): 'Bm',
+    frozenset(['E', 'G', 'B']): 'Em',
+    frozenset(['C', 'Eb', 'G']): 'Cm',
+    frozenset(['D', 'F', 'A']): 'Dm',
+    frozenset(['G', 'Bb', 'D']): 'Gm',
+    frozenset(['C#', 'E', 'G#']): 'C#m',
+}
+
+# 5. DOMINANT 7TH CHORDS
+DOMINANT_SEVENTH_CHORDS = {
+    frozenset(['E', 'G#', 'B', 'D']): 'E7',
+    frozenset(['A', 'C#', 'E', 'G']): 'A7',
+    frozenset(['B', 'D#', 'F#', 'A']): 'B7',
+    frozenset(['F#', 'A#', 'C#', 'E']): 'F#7',
+    frozenset(['C', 'E', 'G', 'Bb']): 'C7',
+    frozenset(['D', 'F#', 'A', 'C']): 'D7',
+    frozenset(['G', 'B', 'D', 'F']): 'G7',
+}
+
+# 6. MAJOR 7TH CHORDS
+MAJOR_SEVENTH_CHORDS = {
+    frozenset(['E', 'G#', 'B', 'D#']): 'Emaj7',
+    frozenset(['A', 'C#', 'E', 'G#']): 'Amaj7', 
+    frozenset(['B', 'D#', 'F#', 'A#']): 'Bmaj7',
+    frozenset(['F#', 'A#', 'C#', 'F']): 'F#maj7',
+    frozenset(['C', 'E', 'G', 'B']): 'Cmaj7',
+    frozenset(['D', 'F#', 'A', 'C#']): 'Dmaj7',
+    frozenset(['G', 'B', 'D', 'F#']): 'Gmaj7',
+    frozenset(['F', 'A', 'C', 'E']): 'Fmaj7',
+}
+
+# Note name spellings → pitch class (C=0 ... B=11)
+PC_TO_ROOT = np.array(['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'])
+NOTE_PC = {name: pc for pc, name in enumerate(PC_TO_ROOT.tolist())}
+NOTE_PC.update({'Db': 1, 'Eb': 3, 'Gb': 6, 'Ab': 8, 'Bb': 10})
+
+def root_note_names(pitches):
+    """Set of root note names (pitch classes, e.g. 'F#') of MIDI pitches"""
+    return set(PC_TO_ROOT[np.asarray(pitches, dtype=np.int64) % 12].tolist())
+
+def _popcount(mask):
+    """Number of pitch classes set in a 12-bit mask"""
+    return bin(mask).count('1')
+
+def _notes_to_mask(note_names):
+    """Convert note names to a 12-bit pitch-class mask"""
+    mask = 0
+    for name in note_names:
+        mask |= 1 << NOTE_PC[name]
+    return mask
+
+def _build_chord_tables():
+    """
+    Index the chord patterns by pitch-class mask
+    
+    Returns:
+        tuple: (exact-match dict {mask: chord name}, subset patterns as
+                (mask, chord name) pairs with the largest patterns first)
+    """
+    # Priority order for exact matches (most specific first)
+    families = (SUSPENDED_CHORDS, MINOR_SEVENTH_CHORDS, MAJOR_SEVENTH_CHORDS,
+                DOMINANT_SEVENTH_CHORDS, BASIC_MAJOR_CHORDS, BASIC_MINOR_CHORDS)
+    exact = {}
+    merged = {}
+    for family in families:
+        for note_set, chord_name in family.items():
+            mask = _notes_to_mask(note_set)
+            exact.setdefault(mask, chord_name)
+            merged[mask] = chord_name
+    # Stable sort: among equally large patterns the first one listed wins
+    subset_patterns = sorted(merged.items(), key=lambda item: -_popcount(item[0]))
+    return exact, subset_patterns
+
+CHORD_TABLE, CHORD_SUBSET_PATTERNS = _build_chord_tables()
+
 def identify_chord_from_pitches(pitches):
     """Comprehensive chord identification including suspended and extended chords"""
     if not pitches:
         return "Silence"
-    
-    try:
-        # Convert MIDI pitches to note names and pitch classes
-        note_names = []
-        pitch_classes = set()
-        
-        for midi_pitch in pitches:
-            try:
-                note_name = librosa.midi_to_note(midi_pitch)
-                # Extract just the note letter (G, C, D, etc.) without octave
-                root_note = note_name[0]
-                if len(note_name) > 1 and note_name[1] in ['#', '♯', 'b', '♭']:
-                    # Convert Unicode symbols to ASCII for consistent matching
-                    sharp_flat = note_name[1]
-                    if sharp_flat == '♯':
-                        sharp_flat = '#'
-                    elif sharp_flat == '♭':
-                        sharp_flat = 'b'
-                    root_note += sharp_flat
-                
-                note_names.append(note_name)
-                pitch_classes.add(root_note)
-            except:
-                continue
-        
-        if not pitch_classes:
-            return "Unknown"
-        
-        # Convert to sorted list for consistent analysis
-        unique_notes = sorted(list(pitch_classes))
-        note_set = frozenset(unique_notes)
-        
-        if len(unique_notes) == 1:
-            return unique_notes[0]  # Single note
-        
-        # COMPREHENSIVE CHORD PATTERNS - HIGHEST PRIORITY FIRST
-        
-        # 1. SUSPENDED CHORDS (sus2, sus4) - CRITICAL FOR USER'S SEQUENCE
-        suspended_chords = {
-            # sus2 chords (root + 2nd + 5th)
-            frozenset(['E', 'F#', 'B']): 'Esus2',
-            frozenset(['A', 'B', 'E']): 'Asus2', 
-            frozenset(['D', 'E', 'A']): 'Dsus2',
-            frozenset(['G', 'A', 'D']): 'Gsus2',
-            frozenset(['C', 'D', 'G']): 'Csus2',
-            frozenset(['F', 'G', 'C']): 'Fsus2',
-            frozenset(['B', 'C#', 'F#']): 'Bsus2',
-            
-            # sus4 chords (root + 4th + 5th)  
-            frozenset(['E', 'A', 'B']): 'Esus4',
-            frozenset(['A', 'D', 'E']): 'Asus4',
-            frozenset(['D', 'G', 'A']): 'Dsus4', 
-            frozenset(['G', 'C', 'D']): 'Gsus4',
-            frozenset(['C', 'F', 'G']): 'Csus4',
-            frozenset(['F', 'Bb', 'C']): 'Fsus4',
-            frozenset(['B', 'E', 'F#']): 'Bsus4',
-        }
-        
-        # 2. MINOR 7TH CHORDS - CRITICAL FOR F#m7
-        minor_seventh_chords = {
-            frozenset(['F#', 'A', 'C#', 'E']): 'F#m7',
-            frozenset(['A', 'C', 'E', 'G']): 'Am7',
-            frozenset(['D', 'F', 'A', 'C']): 'Dm7',
-            frozenset(['E', 'G', 'B', 'D']): 'Em7',
-            frozenset(['B', 'D', 'F#', 'A']): 'Bm7',
-            frozenset(['C', 'Eb', 'G', 'Bb']): 'Cm7',
-            frozenset(['G', 'Bb', 'D', 'F']): 'Gm7',
-            frozenset(['C#', 'E', 'G#', 'B']): 'C#m7',
-        }
-        
-        # 3. BASIC MAJOR CHORDS  
-        basic_major = {
-            frozenset(['E', 'G#', 'B']): 'E',
-            frozenset(['A', 'C#', 'E']): 'A',
-            frozenset(['B', 'D#', 'F#']): 'B',
-            frozenset(['F#', 'A#', 'C#']): 'F#',
-            frozenset(['C', 'E', 'G']): 'C',
-            frozenset(['D', 'F#', 'A']): 'D',
-            frozenset(['G', 'B', 'D']): 'G',
-            frozenset(['F', 'A', 'C']): 'F',
-        }
-        
-        # 4. BASIC MINOR CHORDS
-        basic_minor = {
-            frozenset(['F#', 'A', 'C#']): 'F#m',
-            frozenset(['A', 'C', 'E']): 'Am',
-            frozenset(['B', 'D', 'F#']): 'Bm',
-            frozenset(['E', 'G', 'B']): 'Em',
-            frozenset(['C', 'Eb', 'G']): 'Cm',
-            frozenset(['D', 'F', 'A']): 'Dm',
-            frozenset(['G', 'Bb', 'D']): 'Gm',
-            frozenset(['C#', 'E', 'G#']): 'C#m',
-        }
-        
-        # 5. DOMINANT 7TH CHORDS
-        dominant_seventh = {
-            frozenset(['E', 'G#', 'B', 'D']): 'E7',
-            frozenset(['A', 'C#', 'E', 'G']): 'A7',
-            frozenset(['B', 'D#', 'F#', 'A']): 'B7',
-            frozenset(['F#', 'A#', 'C#', 'E']): 'F#7',
-            frozenset(['C', 'E', 'G', 'Bb']): 'C7',
-            frozenset(['D', 'F#', 'A', 'C']): 'D7',
-            frozenset(['G', 'B', 'D', 'F']): 'G7',
-        }
-        
-        # 6. MAJOR 7TH CHORDS
-        major_seventh = {
-            frozenset(['E', 'G#', 'B', 'D#']): 'Emaj7',
-            frozenset(['A', 'C#', 'E', 'G#']): 'Amaj7', 
-            frozenset(['B', 'D#', 'F#', 'A#']): 'Bmaj7',
-            frozenset(['F#', 'A#', 'C#', 'F']): 'F#maj7',
-            frozenset(['C', 'E', 'G', 'B']): 'Cmaj7',
-            frozenset(['D', 'F#', 'A', 'C#']): 'Dmaj7',
-            frozenset(['G', 'B', 'D', 'F#']): 'Gmaj7',
-            frozenset(['F', 'A', 'C', 'E']): 'Fmaj7',
-        }
-        
-        # CHECK IN PRIORITY ORDER (most specific first)
-        
-        # 1. Check suspended chords FIRST (exact match)
-        if note_set in suspended_chords:
-            return suspended_chords[note_set]
-        
-        # 2. Check minor 7th chords (exact match)  
-        if note_set in minor_seventh_chords:
-            return minor_seventh_chords[note_set]
-            
-        # 3. Check major 7th chords (exact match)
-        if note_set in major_seventh:
-            return major_seventh[note_set]
-            
-        # 4. Check dominant 7th chords (exact match)
-        if note_set in dominant_seventh:
-            return dominant_seventh[note_set]
-        
-        # 5. Check basic chords (exact match)
-        if note_set in basic_major:
-            return basic_major[note_set]
-        if note_set in basic_minor:
-            return basic_minor[note_set]
-        
-        # 6. SUBSET MATCHING for chords with extra notes
-        all_chord_patterns = {
-            **suspended_chords,
-            **minor_seventh_chords, 
-            **major_seventh,
-            **dominant_seventh,
-            **basic_major,
-            **basic_minor
-        }
-        
-        # Find best subset match (prioritize more complex chords)
-        best_match = None
-        best_match_size = 0
-        
-        for pattern, chord_name in all_chord_patterns.items():
-            if pattern.issubset(note_set):
-                if len(pattern) > best_match_size:
-                    best_match = chord_name
-                    best_match_size = len(pattern)
-        
-        if best_match:
-            return best_match
-        
-        # 7. SMART FALLBACK for unrecognized patterns
-        # Look for root note patterns
-        for root in ['E', 'F#', 'A', 'B', 'C', 'D', 'G', 'F']:
-            if root in unique_notes:
-                # Quick sus2 check
-                if root == 'E' and 'F#' in unique_notes and 'B' in unique_notes:
-                    return 'Esus2'
-                elif root == 'F#' and 'A' in unique_notes and 'C#' in unique_notes:
-                    if 'E' in unique_notes:
-                        return 'F#m7'
-                    else:
-                        return 'F#m'
-                elif root == 'A' and 'C#' in unique_notes and 'E' in unique_notes:
-                    return 'A'
-                return root
-        
-        return unique_notes[0] if unique_notes else "Unknown"
-        
-    except Exception as e:
+    return _chord_from_mask(_pitches_to_mask(pitches))
+
+def _pitches_to_mask(pitches):
+    """Pitch classes of MIDI pitches as a 12-bit mask"""
+    mask = 0
+    for midi_pitch in pitches:
+        mask |= 1 << (int(midi_pitch) % 12)
+    return mask
+
+@functools.lru_cache(maxsize=4096)
+def _chord_from_mask(mask):
+    """Name the chord formed by the pitch classes in a 12-bit mask (cached)"""
+    if mask == 0:
         return "Unknown"
+    
+    if mask & (mask - 1) == 0:
+        return str(PC_TO_ROOT[mask.bit_length() - 1])  # Single note
+    
+    # Exact match, checked in priority order (most specific first)
+    chord_name = CHORD_TABLE.get(mask)
+    if chord_name:
+        return chord_name
+    
+    # SUBSET MATCHING for chords with extra notes (prioritize more complex chords)
+    for pattern, chord_name in CHORD_SUBSET_PATTERNS:
+        if pattern & mask == pattern:
+            return chord_name
+    
+    # 7. SMART FALLBACK for unrecognized patterns
+    # Sorted note names for consistent analysis
+    unique_notes = sorted(PC_TO_ROOT[[pc for pc in range(12) if mask >> pc & 1]].tolist())
+    
+    # Look for root note patterns
+    for root in ['E', 'F#', 'A', 'B', 'C', 'D', 'G', 'F']:
+        if root in unique_notes:
+            # Quick sus2 check
+            if root == 'E' and 'F#' in unique_notes and 'B' in unique_notes:
+                return 'Esus2'
+            elif root == 'F#' and 'A' in unique_notes and 'C#' in unique_notes:
+                if 'E' in unique_notes:
+                    return 'F#m7'
+                else:
+                    return 'F#m'
+            elif root == 'A' and 'C#' in unique_notes and 'E' in unique_notes:
+                return 'A'
+            return root
+
+    return unique_notes[0] if unique_notes else "Unknown"
 
 def format_time(seconds):
     """Format time in MM:SS format"""
@@ -313,14 +366,13 @@ def format_time(seconds):
 
 def detect_optimal_window_size(notes, total_duration):
     """Advanced automatic window detection for accurate chord boundary detection"""
-    if not notes:
+    if notes.pitch.size == 0:
         return 2.0, ["No notes found"]
     
     reasoning = []
     
-    # Calculate note density and timing patterns
-    note_times = [note['start'] for note in notes]
-    note_times.sort()
+    # Calculate note density and timing patterns (notes are sorted by start)
+    note_times = notes.start.tolist()
     
     # Find note clusters (chord strikes)
     chord_onsets = []
@@ -371,7 +423,7 @@ def analyze_midi_chords(midi_path, window_size=None):
     
     # Parse MIDI file first to get data for auto-detection
     notes, total_duration = parse_midi_notes(midi_path)
-    if not notes:
+    if notes.pitch.size == 0:
         print("❌ No notes found in MIDI file")
         return
     
@@ -386,14 +438,15 @@ def analyze_midi_chords(midi_path, window_size=None):
         
     print("=" * 50)
     
-    print(f"📊 Found {len(notes)} notes over {total_duration:.1f} seconds")
+    print(f"📊 Found {notes.pitch.size} notes over {total_duration:.1f} seconds")
     
     # Show filtering results
-    musical_notes = filter_musical_notes(notes)
-    filtered_count = len(notes) - len(musical_notes)
+    musical_mask = musical_note_mask(notes)
+    musical_count = int(musical_mask.sum())
+    filtered_count = notes.pitch.size - musical_count
     if filtered_count > 0:
         print(f"🔇 Filtered out {filtered_count} noise/artifact notes")
-        print(f"🎵 {len(musical_notes)} musical notes remain")
+        print(f"🎵 {musical_count} musical notes remain")
     
     # Group notes into time windows
     windows = group_notes_by_time_windows(notes, window_size)
@@ -401,111 +454,92 @@ def analyze_midi_chords(midi_path, window_size=None):
     print()
     
     # Analyze each time window
-    chord_progression = []
+    chord_progression = np.empty(len(windows), dtype=CHORD_SEGMENT_DTYPE)
+    segment_count = 0
+    
+    # Summary lines, collected during the same pass
+    summary_lines = []
+    
+    # Standard chords (from each window's pitch-class mask) of the previous,
+    # current and next window, shifted along one window per iteration so
+    # each is identified once and reused as its neighbours' context
+    current_chord = None
+    next_chord = _chord_from_mask(windows[0]['pitch_mask']) if windows else None
     
     for i, window in enumerate(windows):
         start_time = window['start']
         end_time = window['end']
         window_notes = window['notes']
         
-        if not window_notes:
+        # Get context for intelligent inference: previous chord (if exists)
+        # and next chord (if exists)
+        prev_chord, current_chord = current_chord, next_chord
+        next_chord = _chord_from_mask(windows[i+1]['pitch_mask']) if i < len(windows) - 1 else None
+        
+        if window_notes.pitch.size == 0:
             continue
         
         # Extract unique pitches
-        pitches = list(set(note['pitch'] for note in window_notes))
-        
-        # Get context for intelligent inference
-        prev_chord = None
-        next_chord = None
-        
-        # Get previous chord (if exists)
-        if i > 0:
-            prev_window = windows[i-1]
-            prev_pitches = list(set(note['pitch'] for note in prev_window['notes']))
-            prev_chord = identify_chord_from_pitches(prev_pitches)
-        
-        # Get next chord (if exists)  
-        if i < len(windows) - 1:
-            next_window = windows[i+1]
-            next_pitches = list(set(note['pitch'] for note in next_window['notes']))
-            next_chord = identify_chord_from_pitches(next_pitches)
+        pitches = list(window['pitches'])
         
         # Get extended region pitches for context
         region_start = max(0, i - 1)
         region_end = min(len(windows), i + 2)
-        region_pitches = []
-        for j in range(region_start, region_end):
-            region_pitches.extend(note['pitch'] for note in windows[j]['notes'])
-        region_pitches = list(set(region_pitches))
+        region_windows = windows[region_start:region_end]
+        region_pitches = list(set().union(*(w['pitches'] for w in region_windows)))
+        region_mask = 0
+        for w in region_windows:
+            region_mask |= w['pitch_mask']
         
         # Use context-aware chord identification
-        chord_name = identify_chord_with_context(pitches, prev_chord, next_chord, region_pitches)
+        chord_name = identify_chord_with_context(pitches, prev_chord, next_chord, region_pitches,
+                                                 region_mask)
         
         # Format time range  
         time_range = f"[{format_time(start_time)} - {format_time(end_time)}]"
         
-        chord_progression.append({
-            'start': start_time,
-            'end': end_time, 
-            'chord': chord_name,
-            'note_count': len(window_notes),
-            'unique_pitches': len(pitches),
-            'time_range': time_range
-        })
+        chord_progression[segment_count] = (start_time, end_time, chord_name,
+                                            window_notes.pitch.size, len(pitches))
+        segment_count += 1
+        summary_lines.append(f"{time_range} → {chord_name}")
         
-        print(f"{time_range} → {chord_name}")
-        print(f"    Notes: {len(window_notes)}, Unique pitches: {len(pitches)}")
+        print(summary_lines[-1])
+        print(f"    Notes: {window_notes.pitch.size}, Unique pitches: {len(pitches)}")
         
         # Show the actual notes for debugging
-        note_names = [note['note_name'] for note in window_notes]
-        unique_notes = sorted(set(note_names))
+        unique_notes = sorted(set(NOTE_NAME_TABLE[pitches].tolist()))
         print(f"    Pitches: {', '.join(unique_notes)}")
         
-        # DEBUG: Show exact note analysis for all segments
-        if len(pitches) >= 2:  # Show debug for all chord segments
-            print(f"    🔍 MIDI pitches: {sorted(pitches)}")
-            print(f"    🔍 Note analysis: {[librosa.midi_to_note(p) for p in sorted(pitches)]}")
+        # DEBUG: Show exact note analysis for all chord segments (only
+        # when debug logging is enabled, so nothing is formatted otherwise)
+        if len(pitches) >= 2 and log.isEnabledFor(logging.DEBUG):
+            log.debug("    🔍 MIDI pitches: %s", sorted(pitches))
+            log.debug("    🔍 Note analysis: %s", NOTE_NAME_TABLE[sorted(pitches)].tolist())
             
             # Show what chord patterns are being matched
-            root_notes = set()
-            for p in pitches:
-                try:
-                    note_name = librosa.midi_to_note(p)
-                    root_note = note_name[0]
-                    if len(note_name) > 1 and note_name[1] in ['#', '♯', 'b', '♭']:
-                        sharp_flat = note_name[1]
-                        if sharp_flat == '♯':
-                            sharp_flat = '#'
-                        elif sharp_flat == '♭':
-                            sharp_flat = 'b'
-                        root_note += sharp_flat
-                    root_notes.add(root_note)
-                except:
-                    continue
-            print(f"    🔍 Root notes detected: {sorted(list(root_notes))}")
+            root_notes = root_note_names(pitches)
+            log.debug("    🔍 Root notes detected: %s", sorted(root_notes))
             
             # Check specifically for Esus2 pattern
             if 'E' in root_notes and 'B' in root_notes:
                 if 'F#' in root_notes:
-                    print(f"    🎯 ESUS2 PATTERN DETECTED: E + F# + B")
+                    log.debug("    🎯 ESUS2 PATTERN DETECTED: E + F# + B")
                 else:
-                    print(f"    ❌ Missing F# for Esus2 (has E + B)")
+                    log.debug("    ❌ Missing F# for Esus2 (has E + B)")
         
         print()
     
-    # Convert chord progression to format expected by detect_chord_events
-    chord_segments = [(item['start'], item['end'], item['chord'], item['note_count'], 
-                      []) for item in chord_progression]
+    chord_progression = chord_progression[:segment_count]
     
     # Use professional chord event detection
-    grouped_chords = detect_chord_events(chord_segments)
+    grouped_chords = detect_chord_events(chord_progression)
 
     # Summary with grouped chords
     print("=" * 50)
     print("🎼 CHORD PROGRESSION SUMMARY")
     print("=" * 50)
-    for item in chord_progression:
-        print(f"{item['time_range']} → {item['chord']}")
+    if summary_lines:
+        print("\n".join(summary_lines))
     
     print("\n" + "=" * 50)
     print("🎯 CHORD EVENT DETECTION (Distinct Plays)")
@@ -548,25 +582,57 @@ def analyze_key_signature(notes, chord_events=None):
             return key_from_chords
     
     # Method 2: Note frequency analysis
-    if notes:
+    if notes.pitch.size:
         key_from_notes = detect_key_from_notes(notes)
         if key_from_notes != "Unknown":
             return key_from_notes
     
-    # Method 3: music21 analysis (if available)
-    try:
-        from music21 import stream, pitch, key
-        if notes:
-            key_from_music21 = detect_key_with_music21(notes)
-            if key_from_music21 != "Unknown":
-                return key_from_music21
-    except ImportError:
-        pass
-    except Exception:
-        pass
-    
     return "Unknown"
 
+# Key signature patterns
+MAJOR_KEY_PATTERNS = {
+    # Pattern: [tonic, common chords in that key]
+    'C': ['C', 'F', 'G', 'Am', 'Dm', 'Em'],
+    'G': ['G', 'C', 'D', 'Em', 'Am', 'Bm'],
+    'D': ['D', 'G', 'A', 'Bm', 'Em', 'F#m'],
+    'A': ['A', 'D', 'E', 'F#m', 'Bm', 'C#m'],
+    'E': ['E', 'A', 'B', 'C#m', 'F#m', 'G#m'],
+    'F': ['F', 'Bb', 'C', 'Dm', 'Gm', 'Am'],
+}
+
+MINOR_KEY_PATTERNS = {
+    'Am': ['Am', 'F', 'G', 'C', 'Dm', 'Em', 'E'],
+    'Em': ['Em', 'C', 'D', 'G', 'Am', 'Bm', 'B'],
+    'Bm': ['Bm', 'G', 'A', 'D', 'Em', 'F#m', 'F#'],
+    'F#m': ['F#m', 'D', 'E', 'A', 'Bm', 'C#m', 'C#'],
+    'Dm': ['Dm', 'Bb', 'C', 'F', 'Gm', 'Am', 'A'],
+    'Gm': ['Gm', 'Eb', 'F', 'Bb', 'Cm', 'Dm', 'D'],
+}
+
+def _build_key_matrix():
+    """
+    Encode the key patterns as a 0/1 matrix over a chord vocabulary
+    
+    Returns:
+        tuple: (key labels, {chord name: vocabulary column}, matrix of
+                shape (keys, vocabulary) with 1 where the chord fits the key)
+    """
+    key_labels = ([f"{tonic} major" for tonic in MAJOR_KEY_PATTERNS] +
+                  [f"{tonic[:-1]} minor" for tonic in MINOR_KEY_PATTERNS])
+    patterns = list(MAJOR_KEY_PATTERNS.values()) + list(MINOR_KEY_PATTERNS.values())
+    
+    chord_index = {}
+    for pattern in patterns:
+        for chord_name in pattern:
+            chord_index.setdefault(chord_name, len(chord_index))
+    
+    key_matrix = np.zeros((len(key_labels), len(chord_index)), dtype=np.int64)
+    for row, pattern in enumerate(patterns):
+        key_matrix[row, [chord_index[chord_name] for chord_name in pattern]] = 1
+    return key_labels, chord_index, key_matrix
+
+KEY_LABELS, KEY_CHORD_INDEX, KEY_MATRIX = _build_key_matrix()
+
 def detect_key_from_chord_progression(chord_events):
     """Detect key signature from chord progression patterns"""
     if not chord_events:
@@ -578,55 +644,23 @@ def detect_key_from_chord_progression(chord_events):
     for chord in chords:
         chord_counts[chord] = chord_counts.get(chord, 0) + 1
     
-    # Most common chord is likely the tonic or relative
-    most_common = max(chord_counts.items(), key=lambda x: x[1])[0]
-    
-    # Key signature patterns
-    major_key_patterns = {
-        # Pattern: [tonic, common chords in that key]
-        'C': ['C', 'F', 'G', 'Am', 'Dm', 'Em'],
-        'G': ['G', 'C', 'D', 'Em', 'Am', 'Bm'],
-        'D': ['D', 'G', 'A', 'Bm', 'Em', 'F#m'],
-        'A': ['A', 'D', 'E', 'F#m', 'Bm', 'C#m'],
-        'E': ['E', 'A', 'B', 'C#m', 'F#m', 'G#m'],
-        'F': ['F', 'Bb', 'C', 'Dm', 'Gm', 'Am'],
-    }
-    
-    minor_key_patterns = {
-        'Am': ['Am', 'F', 'G', 'C', 'Dm', 'Em', 'E'],
-        'Em': ['Em', 'C', 'D', 'G', 'Am', 'Bm', 'B'],
-        'Bm': ['Bm', 'G', 'A', 'D', 'Em', 'F#m', 'F#'],
-        'F#m': ['F#m', 'D', 'E', 'A', 'Bm', 'C#m', 'C#'],
-        'Dm': ['Dm', 'Bb', 'C', 'F', 'Gm', 'Am', 'A'],
-        'Gm': ['Gm', 'Eb', 'F', 'Bb', 'Cm', 'Dm', 'D'],
-    }
-    
-    # Score each possible key
-    key_scores = {}
-    
-    # Check major keys
-    for key, pattern in major_key_patterns.items():
-        score = 0
-        for chord in chords:
-            if chord in pattern:
-                score += chord_counts[chord]
-        key_scores[f"{key} major"] = score
-    
-    # Check minor keys  
-    for key, pattern in minor_key_patterns.items():
-        score = 0
-        for chord in chords:
-            if chord in pattern:
-                score += chord_counts[chord]
-        key_scores[f"{key[:-1]} minor"] = score
-    
-    # Find best match
-    if key_scores:
-        best_key = max(key_scores.items(), key=lambda x: x[1])
-        if best_key[1] > 0:  # At least some chords match
-            return best_key[0]
+    # Score each possible key in one product: every occurrence of a chord
+    # that fits the key adds that chord's total count, i.e. count² per chord
+    chord_weights = np.zeros(len(KEY_CHORD_INDEX), dtype=np.int64)
+    for chord, count in chord_counts.items():
+        column = KEY_CHORD_INDEX.get(chord)
+        if column is not None:
+            chord_weights[column] = count * count
+    key_scores = KEY_MATRIX @ chord_weights
+    
+    # Find best match (argmax keeps the first key listed on ties)
+    best_key = int(np.argmax(key_scores))
+    if key_scores[best_key] > 0:  # At least some chords match
+        return KEY_LABELS[best_key]
     
     # Fallback: if most common chord is minor, assume that's the key
+    # (most common chord is likely the tonic or relative; ties go to the first seen)
+    most_common = list(chord_counts)[int(np.argmax(list(chord_counts.values())))]
     if most_common.endswith('m') and not most_common.endswith('maj'):
         root = most_common[:-1] if most_common.endswith('m') else most_common
         return f"{root} minor"
@@ -635,32 +669,20 @@ def detect_key_from_chord_progression(chord_events):
 
 def detect_key_from_notes(notes):
     """Detect key from note frequency analysis"""
-    if not notes:
+    if notes.pitch.size == 0:
         return "Unknown"
     
     try:
-        # Count note frequencies
-        note_counts = {}
-        for note in notes:
-            try:
-                note_name = librosa.midi_to_note(note['pitch'])
-                root_note = note_name[0]
-                if len(note_name) > 1 and note_name[1] in ['#', '♯', 'b', '♭']:
-                    sharp_flat = note_name[1]
-                    if sharp_flat == '♯':
-                        sharp_flat = '#'
-                    elif sharp_flat == '♭':
-                        sharp_flat = 'b'
-                    root_note += sharp_flat
-                note_counts[root_note] = note_counts.get(root_note, 0) + 1
-            except:
-                continue
-        
-        if not note_counts:
-            return "Unknown"
+        # Count note frequencies per pitch class, listing the pitch classes
+        # in order of first appearance so ties go to the earliest note
+        pitch_classes = notes.pitch % 12
+        seen_pcs, first_seen, seen_counts = np.unique(pitch_classes, return_index=True, return_counts=True)
+        order = np.argsort(first_seen)
+        seen_pcs, seen_counts = seen_pcs[order], seen_counts[order]
+        note_counts = dict(zip(PC_TO_ROOT[seen_pcs].tolist(), seen_counts.tolist()))
         
         # Find most common note
-        most_common_note = max(note_counts.items(), key=lambda x: x[1])[0]
+        most_common_note = str(PC_TO_ROOT[seen_pcs[np.argmax(seen_counts)]])
         
         # Simple heuristics for major vs minor
         # Check for presence of major/minor third intervals
@@ -691,114 +713,77 @@ def detect_key_from_notes(notes):
     except Exception:
         return "Unknown"
 
-def detect_key_with_music21(notes):
-    """Detect key using music21 library"""
-    try:
-        from music21 import stream, pitch, key
-        
-        # Create a stream with weighted pitches
-        s = stream.Stream()
-        note_counts = {}
-        
-        for note in notes:
-            try:
-                midi_pitch = note['pitch']
-                note_counts[midi_pitch] = note_counts.get(midi_pitch, 0) + 1
-            except:
-                continue
-        
-        # Add notes to stream based on frequency
-        for midi_pitch, count in note_counts.items():
-            try:
-                p = pitch.Pitch(midi=midi_pitch)
-                # Add multiple instances based on frequency (but cap at 10)
-                for _ in range(min(count, 10)):
-                    s.append(p)
-            except:
-                continue
-        
-        if len(s) == 0:
-            return "Unknown"
-        
-        # Analyze key
-        analyzed_key = s.analyze('key')
-        if analyzed_key:
-            mode = 'major' if analyzed_key.mode == 'major' else 'minor'
-            return f"{analyzed_key.tonic.name} {mode}"
-        
-    except Exception:
-        pass
+def detect_chord_events(chord_segments):
+    """Conservative chord event detection to avoid over-segmentation
     
-    return "Unknown"
-
-def detect_chord_events(window_segments):
-    """Conservative chord event detection to avoid over-segmentation"""
-    if not window_segments:
+    Args:
+        chord_segments: Structured array of CHORD_SEGMENT_DTYPE records
+        
+    Returns:
+        list: Chord event dicts (start, end, chord, play_number, duration, total_notes)
+    """
+    if len(chord_segments) == 0:
         return []
     
     chord_events = []
-    print(f"🔍 Analyzing {len(window_segments)} chord segments...")
-    
-    i = 0
-    while i < len(window_segments):
-        start_time, end_time, chord, note_count, pitches = window_segments[i]
-        
-        # Skip silence and very weak chords
-        if chord == "Silence" or note_count < 2:
-            i += 1
-            continue
-            
-        print(f"   Segment {i+1}: [{start_time:.1f}-{end_time:.1f}] → {chord} ({note_count} notes)")
-        
-        # Find all consecutive segments with the same chord
-        current_chord = chord
-        chord_start = start_time
-        chord_end = end_time
-        total_notes = note_count
-        
-        # Look ahead to group consecutive same-chord segments
-        j = i + 1
-        while j < len(window_segments):
-            next_start, next_end, next_chord, next_notes, _ = window_segments[j]
-            
-            if next_chord != current_chord or next_notes < 2:
-                break
-                
-            # Check for gap between segments
-            gap = next_start - chord_end
-            
-            # More conservative: only split if gap > 1.0s (was 0.5s)
-            if gap > 1.0:
-                break
-                
-            # Extend the current chord
-            chord_end = next_end
-            total_notes += next_notes
-            j += 1
+    print(f"🔍 Analyzing {len(chord_segments)} chord segments...")
+    
+    # Segment columns, with chords encoded as integer labels
+    starts = chord_segments['start']
+    ends = chord_segments['end']
+    chords = chord_segments['chord']
+    note_counts = chord_segments['note_count'].astype(np.int64)
+    _, labels = np.unique(chords, return_inverse=True)
+    
+    # Skip silence and very weak chords
+    valid = (note_counts >= 2) & (chords != "Silence")
+    
+    # Group consecutive same-chord segments: a segment extends the previous
+    # one's event unless there is a gap > 1.0s (more conservative, was 0.5s)
+    joins = np.zeros(len(chord_segments), dtype=bool)
+    joins[1:] = (valid[1:] & valid[:-1] & (labels[1:] == labels[:-1]) &
+                 (starts[1:] - ends[:-1] <= 1.0))
+    run_starts = np.flatnonzero(valid & ~joins)
+    run_ends = np.flatnonzero(valid & ~np.append(joins[1:], False))
+    note_totals = np.concatenate(([0], np.cumsum(note_counts)))
+    run_notes = note_totals[run_ends + 1] - note_totals[run_starts]
+    
+    play_counter = defaultdict(int)
+    for i, chord_start, end_time, current_chord, note_count, chord_end, total_notes in zip(
+            run_starts.tolist(), starts[run_starts].tolist(), ends[run_starts].tolist(),
+            chords[run_starts].tolist(), note_counts[run_starts].tolist(),
+            ends[run_ends].tolist(), run_notes.tolist()):
+        
+        print(f"   Segment {i+1}: [{chord_start:.1f}-{end_time:.1f}] → {current_chord} ({note_count} notes)")
         
         # Create single event for the chord group (less aggressive splitting)
+        play_counter[current_chord] += 1
         chord_events.append({
             'start': chord_start,
             'end': chord_end,
             'chord': current_chord,
-            'play_number': len([e for e in chord_events if e['chord'] == current_chord]) + 1,
+            'play_number': play_counter[current_chord],
             'duration': chord_end - chord_start,
             'total_notes': total_notes
         })
         
-        print(f"   ✅ Detected: {current_chord} (play #{len([e for e in chord_events if e['chord'] == current_chord])}) from {chord_start:.1f}s to {chord_end:.1f}s")
-        
-        i = j  # Skip to next unprocessed segment
+        print(f"   ✅ Detected: {current_chord} (play #{play_counter[current_chord]}) from {chord_start:.1f}s to {chord_end:.1f}s")
+    
+    # POST-PROCESS: Merge very short events that are likely over-segmented.
+    # An event (<0.8s) merges into the previous one when it has the same
+    # chord and starts less than 1.5s after it ends; merging only moves the
+    # previous event's end, so this is decided per adjacent pair up front
+    event_labels = labels[run_starts]
+    event_starts = starts[run_starts]
+    event_ends = ends[run_ends]
+    event_durations = event_ends - event_starts
+    merges = np.zeros(len(chord_events), dtype=bool)
+    merges[1:] = ((event_labels[1:] == event_labels[:-1]) & (event_durations[1:] < 0.8) &
+                  (event_starts[1:] - event_ends[:-1] < 1.5))
     
-    # POST-PROCESS: Merge very short events that are likely over-segmented
     merged_events = []
-    for event in chord_events:
-        # If this event is very short (<0.8s) and same chord as previous, merge them
-        if (merged_events and 
-            event['chord'] == merged_events[-1]['chord'] and 
-            event['duration'] < 0.8 and 
-            event['start'] - merged_events[-1]['end'] < 1.5):
-            
+    for event, merge in zip(chord_events, merges.tolist()):
+        if merge:
             # Merge with previous event
             last_event = merged_events[-1]
             last_event['end'] = event['end']
@@ -809,62 +794,65 @@ def detect_chord_events(window_segments):
             merged_events.append(event)
     
     # Re-number play counts after merging
-    play_counts = {}
+    play_counts = defaultdict(int)
     for event in merged_events:
-        chord = event['chord']
-        play_counts[chord] = play_counts.get(chord, 0) + 1
-        event['play_number'] = play_counts[chord]
+        play_counts[event['chord']] += 1
+        event['play_number'] = play_counts[event['chord']]
     
     print(f"\n🎯 Total chord events detected: {len(merged_events)}")
     
     return merged_events
 
-def identify_chord_with_context(pitches, prev_chord=None, next_chord=None, all_pitches_in_region=None):
-    """Enhanced chord identification with aggressive Am7 detection and missing note inference"""
+# Pitch-class masks for the missing-note inference in identify_chord_with_context
+E_B_MASK = _notes_to_mask(['E', 'B'])
+E_B_G_SHARP_MASK = _notes_to_mask(['E', 'B', 'G#'])
+F_SHARP_MINOR_MASK = _notes_to_mask(['F#', 'A', 'C#'])
+A_B_E_MASK = _notes_to_mask(['A', 'B', 'E'])
+G_SHARP_MASK = _notes_to_mask(['G#'])
+C_SHARP_MASK = _notes_to_mask(['C#'])
+A_MASK = _notes_to_mask(['A'])
+
+def identify_chord_with_context(pitches, prev_chord=None, next_chord=None, all_pitches_in_region=None,
+                                region_mask=None):
+    """
+    Enhanced chord identification with aggressive Am7 detection and missing note inference
+    
+    region_mask is the pitch-class mask of all_pitches_in_region; callers that
+    already know it (e.g. from per-window masks) can pass it to skip
+    recomputing it from the region's pitches.
+    """
+    
+    # Pitch classes present, as a 12-bit mask (shared by the standard lookup
+    # and the inference rules below)
+    detected_mask = _pitches_to_mask(pitches)
     
     # First try standard identification
-    standard_chord = identify_chord_from_pitches(pitches)
+    standard_chord = _chord_from_mask(detected_mask) if pitches else "Silence"
     
     # INTELLIGENT MISSING NOTE INFERENCE
-    # Convert pitches to note names for analysis
-    detected_notes = set()
-    for midi_pitch in pitches:
-        try:
-            note_name = librosa.midi_to_note(midi_pitch)
-            root_note = note_name[0]
-            if len(note_name) > 1 and note_name[1] in ['#', '♯', 'b', '♭']:
-                sharp_flat = note_name[1]
-                if sharp_flat == '♯':
-                    sharp_flat = '#'
-                elif sharp_flat == '♭':
-                    sharp_flat = 'b'
-                root_note += sharp_flat
-            detected_notes.add(root_note)
-        except:
-            continue
     
     # MISSING NOTE PATTERNS - Common transcription failures
     
     # 1. ESUS2 INFERENCE: E + B (missing F#) → Esus2
-    if detected_notes == {'E', 'B'} or ({'E', 'B'}.issubset(detected_notes) and 'G#' not in detected_notes):
+    if detected_mask & E_B_MASK == E_B_MASK and not detected_mask & G_SHARP_MASK:
         # If we have E + B but no G# (which would make it E major), likely Esus2
         print(f"    🎯 INFERRED: E + B pattern → likely Esus2 (missing F#)")
         return 'Esus2'
     
     # 2. F#m7 INFERENCE: F# + A + C# (missing E) → F#m7
-    if detected_notes == {'F#', 'A', 'C#'} or ({'F#', 'A', 'C#'}.issubset(detected_notes)):
+    if detected_mask & F_SHARP_MINOR_MASK == F_SHARP_MINOR_MASK:
         # Check if context suggests F#m7
         if prev_chord in ['Esus2', 'E'] or next_chord in ['Esus2', 'E']:
             print(f"    🎯 INFERRED: F# + A + C# in E context → likely F#m7")
             return 'F#m7'
     
     # 3. ASUS2 INFERENCE: A + B + E (should be A + B + E) → Asus2  
-    if detected_notes == {'A', 'B', 'E'} or ({'A', 'B', 'E'}.issubset(detected_notes) and 'C#' not in detected_notes):
+    if detected_mask & A_B_E_MASK == A_B_E_MASK and not detected_mask & C_SHARP_MASK:
         print(f"    🎯 INFERRED: A + B + E pattern → likely Asus2")
         return 'Asus2'
     
     # 4. MAJOR CHORD DISAMBIGUATION: E + B + G# is definitely E major (not Esus2)
-    if {'E', 'B', 'G#'}.issubset(detected_notes):
+    if detected_mask & E_B_G_SHARP_MASK == E_B_G_SHARP_MASK:
         print(f"    🎯 CONFIRMED: E + B + G# → definitely E major")
         return 'E'
     
@@ -875,24 +863,11 @@ def identify_chord_with_context(pitches, prev_chord=None, next_chord=None, all_p
         
         if am_context and all_pitches_in_region:
             # Check if we have A note in the broader region
-            region_notes = set()
-            for midi_pitch in all_pitches_in_region:
-                try:
-                    note_name = librosa.midi_to_note(midi_pitch)
-                    root_note = note_name[0]
-                    if len(note_name) > 1 and note_name[1] in ['#', '♯', 'b', '♭']:
-                        sharp_flat = note_name[1]
-                        if sharp_flat == '♯':
-                            sharp_flat = '#'
-                        elif sharp_flat == '♭':
-                            sharp_flat = 'b'
-                        root_note += sharp_flat
-                    region_notes.add(root_note)
-                except:
-                    continue
+            if region_mask is None:
+                region_mask = _pitches_to_mask(all_pitches_in_region)
             
             # If we have A in the region, this C is probably Am7
-            if 'A' in region_notes:
+            if region_mask & A_MASK:
                 return "Am7"
             
             # Even if no A detected, between Am chords, C is likely Am7
@@ -901,13 +876,18 @@ def identify_chord_with_context(pitches, prev_chord=None, next_chord=None, all_p
     
     # If context gives us a 7th chord and standard gives us a basic chord, prefer context
     if all_pitches_in_region and len(all_pitches_in_region) > len(pitches):
-        context_chord = identify_chord_from_pitches(all_pitches_in_region)
+        if region_mask is None:
+            region_mask = _pitches_to_mask(all_pitches_in_region)
+        context_chord = _chord_from_mask(region_mask)
         if '7' in context_chord and '7' not in standard_chord:
             return context_chord
     
     return standard_chord
 
 def main():
+    # Per-window debug analysis is logged at DEBUG level and hidden by default
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     if len(sys.argv) < 2:
         print("Usage: python midi_to_chords.py <midi_file> [window_size]")
         print("\nExamples:")
@@ -1,17 +1,171 @@
 import sys
 import time
-import soundfile as sf
 import librosa
 import numpy as np
 import psutil
 import os
 from pathlib import Path
+from numba import njit, prange
+from _audio_math import hz_to_midi, midi_to_hz, midi_to_note, note_to_hz, read_audio
+
+# YIN settings (same framing as librosa.pyin's defaults)
+YIN_FRAME_LENGTH = 2048
+YIN_HOP_LENGTH = 512
+YIN_THRESHOLD = 0.1
+YIN_SMOOTHING_FRAMES = 4           # Neighbours on each side for the continuity median
+YIN_OCTAVE_ERROR_SEMITONES = 11    # Deviation from that median treated as an octave error
+YIN_FMIN = note_to_hz('C2')
+YIN_FMAX = note_to_hz('C7')
 
 def get_memory_usage():
     """Get current memory usage in MB"""
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024 / 1024
 
+@njit(fastmath=True, cache=True)
+def _yin_cmnd(x, tau_max, win_length):
+    """Cumulative-mean-normalized difference function of one frame (lags 0..tau_max+1)"""
+    cmnd = np.ones(tau_max + 2)
+    running_sum = 0.0
+    for tau in range(1, tau_max + 2):
+        diff = 0.0
+        for j in range(win_length - 1):
+            delta = x[j] - x[j + tau]
+            diff += delta * delta
+        running_sum += diff
+        cmnd[tau] = diff * tau / running_sum if running_sum > 0.0 else 1.0
+    return cmnd
+
+@njit(fastmath=True, cache=True)
+def _parabolic_period(cmnd, tau):
+    """Refine a CMND minimum at integer lag tau by parabolic interpolation"""
+    a = cmnd[tau - 1]
+    b = cmnd[tau]
+    c = cmnd[tau + 1]
+    curvature = a - 2.0 * b + c
+    shift = 0.5 * (a - c) / curvature if curvature > 0.0 else 0.0
+    return tau + shift
+
+@njit(parallel=True, fastmath=True, cache=True)
+def yin_periods(frames, tau_min, tau_max, threshold):
+    """
+    YIN period estimate for each row of a (n_frames, frame_length) buffer
+    
+    Frames are processed in parallel. For each frame the difference
+    function over lags 0..tau_max is normalized by its cumulative mean, the
+    first dip below `threshold` (from tau_min on) is followed down to its
+    local minimum and refined by parabolic interpolation. Without such a
+    dip the global minimum is used (as librosa.yin does), unless the frame
+    shows no periodicity at all.
+    
+    Returns:
+        np.ndarray: Period in samples per frame (0.0 for unvoiced frames)
+    """
+    n_frames, frame_length = frames.shape
+    win_length = frame_length - tau_max
+    periods = np.zeros(n_frames)
+    
+    for f in prange(n_frames):
+        cmnd = _yin_cmnd(frames[f], tau_max, win_length)
+        
+        # First dip below the threshold, followed down to its minimum
+        tau = tau_min
+        while tau <= tau_max and cmnd[tau] >= threshold:
+            tau += 1
+        if tau <= tau_max:
+            while tau < tau_max and cmnd[tau + 1] < cmnd[tau]:
+                tau += 1
+        else:
+            tau = tau_min
+            for k in range(tau_min + 1, tau_max + 1):
+                if cmnd[k] < cmnd[tau]:
+                    tau = k
+            if cmnd[tau] >= 1.0:
+                continue
+        
+        periods[f] = _parabolic_period(cmnd, tau)
+    
+    return periods
+
+@njit(parallel=True, fastmath=True, cache=True)
+def correct_octave_errors(frames, periods, reference_periods, tau_min, tau_max):
+    """
+    Re-pick the period of frames flagged as octave errors
+    
+    For every frame with a reference period (> 0) the CMND dip closest in
+    pitch to that reference replaces the YIN estimate; other frames are
+    returned unchanged.
+    
+    Returns:
+        np.ndarray: Corrected periods (0.0 for unvoiced frames)
+    """
+    n_frames, frame_length = frames.shape
+    win_length = frame_length - tau_max
+    corrected = periods.copy()
+    
+    for f in prange(n_frames):
+        reference = reference_periods[f]
+        if reference <= 0.0:
+            continue
+        
+        # Local CMND minimum (with some periodicity) closest to the reference
+        cmnd = _yin_cmnd(frames[f], tau_max, win_length)
+        best_tau = -1
+        best_distance = np.inf
+        for k in range(tau_min + 1, tau_max):
+            if cmnd[k] < 1.0 and cmnd[k] < cmnd[k - 1] and cmnd[k] <= cmnd[k + 1]:
+                distance = abs(np.log2(k / reference))
+                if distance < best_distance:
+                    best_distance = distance
+                    best_tau = k
+        if best_tau > 0:
+            corrected[f] = _parabolic_period(cmnd, best_tau)
+    
+    return corrected
+
+def yin_pitch_track(y, sr, fmin, fmax):
+    """
+    Frame-wise fundamental frequency with the compiled YIN kernel
+    
+    Frames are centered like librosa.pyin's (frame t starts at
+    t * YIN_HOP_LENGTH - YIN_FRAME_LENGTH // 2), so frame indices line up
+    with librosa.time_to_frames.
+    
+    This is YIN plus a median-based octave correction, not pYIN: there is
+    no voicing model or Viterbi decoding, so pitches on note transitions
+    can still differ from librosa.pyin's (which glides through them).
+    
+    Returns:
+        np.ndarray: f0 in Hz per frame, NaN for unvoiced frames
+    """
+    padded = np.pad(y, YIN_FRAME_LENGTH // 2)
+    frames = np.ascontiguousarray(
+        librosa.util.frame(padded, frame_length=YIN_FRAME_LENGTH, hop_length=YIN_HOP_LENGTH).T)
+    
+    tau_min = max(1, int(sr / fmax))
+    tau_max = min(YIN_FRAME_LENGTH // 2, int(np.ceil(sr / fmin)))
+    periods = yin_periods(frames, tau_min, tau_max, YIN_THRESHOLD)
+    
+    # Continuity correction (a light stand-in for pYIN's Viterbi smoothing):
+    # on note transitions plain YIN often locks onto a subharmonic for a few
+    # frames. Frames about an octave or more away from the median pitch of
+    # their neighbourhood re-pick the CMND dip closest to that median
+    voiced = periods > 0
+    midi = np.full(len(periods), np.nan)
+    midi[voiced] = hz_to_midi(sr / periods[voiced])
+    neighbourhood = np.lib.stride_tricks.sliding_window_view(
+        np.pad(midi, YIN_SMOOTHING_FRAMES, constant_values=np.nan), 2 * YIN_SMOOTHING_FRAMES + 1)
+    reference = np.zeros(len(periods))
+    local_median = np.nanmedian(neighbourhood[voiced], axis=1)
+    outlier = np.abs(midi[voiced] - local_median) >= YIN_OCTAVE_ERROR_SEMITONES
+    reference[np.flatnonzero(voiced)[outlier]] = sr / midi_to_hz(local_median[outlier])
+    periods = correct_octave_errors(frames, periods, reference, tau_min, tau_max)
+    
+    f0 = np.full(len(periods), np.nan)
+    voiced = periods > 0
+    f0[voiced] = sr / periods[voiced]
+    return f0
+
 def simple_transcription_analysis(audio_path):
     """
     Simple transcription analysis using librosa
@@ -25,7 +179,7 @@ def simple_transcription_analysis(audio_path):
     
     # Load audio
     load_start = time.time()
-    y, sr = librosa.load(audio_path)
+    y, sr = read_audio(audio_path)
     load_time = time.time() - load_start
     
     # Memory after loading
@@ -40,26 +194,27 @@ def simple_transcription_analysis(audio_path):
     
     # 1. Pitch tracking (fundamental frequency estimation)
     pitch_start = time.time()
-    f0, voiced_flag, voiced_probs = librosa.pyin(y, 
-                                                 fmin=librosa.note_to_hz('C2'), 
-                                                 fmax=librosa.note_to_hz('C7'))
+    f0 = yin_pitch_track(y, sr, fmin=YIN_FMIN, fmax=YIN_FMAX)
     pitch_time = time.time() - pitch_start
     
-    # 2. Onset detection
+    # 2. Spectral analysis (one STFT, shared by onset detection and chroma)
+    spectral_start = time.time()
+    stft = librosa.stft(y)
+    power = np.abs(stft) ** 2
+    spectral_time = time.time() - spectral_start
+    
+    # 3. Onset detection (same log-mel onset envelope onset_detect builds from y)
     onset_start = time.time()
-    onset_frames = librosa.onset.onset_detect(y=y, sr=sr, units='time')
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+    onset_envelope = librosa.onset.onset_strength(S=mel_db, sr=sr)
+    onset_frames = librosa.onset.onset_detect(onset_envelope=onset_envelope, sr=sr, units='time')
     onset_time = time.time() - onset_start
     
-    # 3. Chroma features (for note identification)
+    # 4. Chroma features (for note identification)
     chroma_start = time.time()
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr)
     chroma_time = time.time() - chroma_start
     
-    # 4. Spectral analysis
-    spectral_start = time.time()
-    stft = librosa.stft(y)
-    spectral_time = time.time() - spectral_start
-    
     analysis_time = time.time() - analysis_start
     
     # Memory after analysis
@@ -70,25 +225,24 @@ def simple_transcription_analysis(audio_path):
     valid_pitches = f0[~np.isnan(f0)]
     
     if len(valid_pitches) > 0 and len(onset_frames) > 0:
-        # Create simple note events based on onsets and pitch
-        for i, onset_time in enumerate(onset_frames):
-            if i < len(onset_frames) - 1:
-                duration = onset_frames[i+1] - onset_time
-            else:
-                duration = len(y)/sr - onset_time
-            
-            # Get average pitch around this onset
-            onset_frame = librosa.time_to_frames(onset_time, sr=sr)
-            if onset_frame < len(f0):
-                pitch_hz = f0[onset_frame]
-                if not np.isnan(pitch_hz):
-                    midi_note = librosa.hz_to_midi(pitch_hz)
-                    note_events.append({
-                        'start': onset_time,
-                        'duration': duration,
-                        'midi_note': midi_note,
-                        'frequency': pitch_hz
-                    })
+        # Create simple note events based on onsets and pitch: each note lasts
+        # until the next onset (the last one until the end of the audio) and
+        # takes the pitch of its onset frame, if that frame is voiced
+        durations = np.diff(np.append(onset_frames, len(y) / sr))
+        onset_idx = librosa.time_to_frames(onset_frames, sr=sr)
+        in_range = onset_idx < len(f0)
+        pitch_hz = np.full(len(onset_frames), np.nan)
+        pitch_hz[in_range] = f0[onset_idx[in_range]]
+        voiced = ~np.isnan(pitch_hz)
+        midi_notes = hz_to_midi(pitch_hz[voiced])
+        
+        note_events = [
+            {'start': start, 'duration': duration, 'midi_note': midi_note, 'frequency': frequency}
+            for start, duration, midi_note, frequency in zip(
+                onset_frames[voiced].tolist(), durations[voiced].tolist(),
+                midi_notes.tolist(), pitch_hz[voiced].tolist()
+            )
+        ]
     
     # Results
     print(f"\n📊 Analysis Results:")
@@ -106,7 +260,7 @@ def simple_transcription_analysis(audio_path):
     if note_events:
         print(f"\n🎹 First few detected notes:")
         for i, note in enumerate(note_events[:5]):
-            note_name = librosa.midi_to_note(int(note['midi_note']))
+            note_name = midi_to_note(int(note['midi_note']))
             print(f"   {i+1}. {note_name} at {note['start']:.2f}s ({note['frequency']:.1f} Hz)")
     
     total_time = load_time + analysis_time
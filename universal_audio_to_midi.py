@@ -14,18 +14,98 @@ Features:
 
 import librosa
 import numpy as np
-import pretty_midi
 from pathlib import Path
 import argparse
 import sys
 import time
+import struct
+import importlib.util
+from _audio_math import hz_to_midi, note_to_hz, read_audio
 
-try:
-    import crepe
-    CREPE_AVAILABLE = True
-except ImportError:
-    CREPE_AVAILABLE = False
-    print("⚠️  CREPE not available. Install with: pip install crepe tensorflow")
+CREPE_WARNING = "⚠️  CREPE not available. Install with: pip install crepe tensorflow"
+
+# CREPE pulls in TensorFlow, so only check that it is installed here and
+# import it on first use (see _get_crepe)
+CREPE_AVAILABLE = importlib.util.find_spec('crepe') is not None
+if not CREPE_AVAILABLE:
+    print(CREPE_WARNING)
+
+_crepe = None
+
+def _get_crepe():
+    """
+    Import the crepe module once and return it
+    
+    Returns None (and turns CREPE_AVAILABLE off, so the librosa path is
+    used from then on) if crepe or TensorFlow fails to import.
+    """
+    global _crepe, CREPE_AVAILABLE
+    if _crepe is None and CREPE_AVAILABLE:
+        try:
+            import crepe
+            _crepe = crepe
+        except ImportError:
+            CREPE_AVAILABLE = False
+            print(CREPE_WARNING)
+    return _crepe
+
+CREPE_MODEL_CAPACITY = 'large'  # Best accuracy
+
+# pyin search range (wide frequency range, C1-C8)
+PYIN_FMIN = note_to_hz('C1')
+PYIN_FMAX = note_to_hz('C8')
+
+# MIDI output timing: 120 BPM at pretty_midi's default resolution
+MIDI_TICKS_PER_BEAT = 220
+MIDI_TEMPO = 500000  # Microseconds per beat (120 BPM)
+MIDI_TICK_SECONDS = 60.0 / (120.0 * MIDI_TICKS_PER_BEAT)
+
+def _vlq(value):
+    """Encode a non-negative integer as a MIDI variable-length quantity"""
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(encoded))
+
+def write_midi_file(output_path, pitches, starts, ends, velocities,
+                    track_name="Audio Transcription", program=0):
+    """
+    Write notes as a single-track (type 0) MIDI file on channel 0
+    
+    Times are quantized and events ordered the way pretty_midi writes them:
+    by tick, then pitch, with a note-off ahead of a note-on of the same pitch.
+    
+    Args:
+        output_path: Path of the .mid file to write
+        pitches, starts, ends, velocities: Parallel note arrays (times in seconds)
+        track_name: Track name meta event
+        program: General MIDI program number (0 = acoustic grand piano)
+    """
+    count = len(pitches)
+    ticks = np.rint(np.concatenate([starts, ends]) / MIDI_TICK_SECONDS).astype(np.int64)
+    event_pitches = np.concatenate([pitches, pitches]).astype(np.int64)
+    event_velocities = np.concatenate([velocities, np.zeros(count)]).astype(np.int64)  # 0 = note-off
+    order = np.lexsort((event_velocities, event_pitches, ticks))
+    deltas = np.diff(ticks[order], prepend=0)
+    
+    name = track_name.encode('latin-1')
+    track = bytearray()
+    track += b'\x00\xff\x58\x04\x04\x02\x18\x08'                 # Time signature 4/4
+    track += b'\x00\xff\x51\x03' + MIDI_TEMPO.to_bytes(3, 'big')   # Tempo
+    track += b'\x00\xff\x03' + _vlq(len(name)) + name               # Track name
+    track += struct.pack('>BBB', 0, 0xC0, program)                     # Program change
+    for delta, pitch, velocity in zip(deltas.tolist(), event_pitches[order].tolist(),
+                                      event_velocities[order].tolist()):
+        track += _vlq(delta)
+        track += struct.pack('>BBB', 0x90, pitch, velocity)            # Note on/off
+    track += b'\x00\xff\x2f\x00'                                   # End of track
+    
+    with open(output_path, 'wb') as midi_file:
+        midi_file.write(struct.pack('>4sIHHH', b'MThd', 6, 0, 1, MIDI_TICKS_PER_BEAT))
+        midi_file.write(struct.pack('>4sI', b'MTrk', len(track)))
+        midi_file.write(track)
 
 class AudioToMIDI:
     def __init__(self, 
@@ -50,12 +130,26 @@ class AudioToMIDI:
         self.min_note_duration = min_note_duration
         self.max_note_duration = max_note_duration
         
+    def warmup(self):
+        """Load the CREPE model ahead of time so batch conversions share it"""
+        crepe = _get_crepe()
+        if crepe is None:
+            return
+        
+        print("🧠 Loading CREPE model...")
+        start_time = time.time()
+        
+        # crepe keeps built models in a per-capacity cache that predict() reuses
+        crepe.core.build_and_load_model(CREPE_MODEL_CAPACITY)
+        
+        print(f"   Model ready in {time.time() - start_time:.1f}s")
+        
     def load_audio(self, audio_path):
         """Load and preprocess audio"""
         print(f"🎵 Loading audio: {Path(audio_path).name}")
         
-        # Load with librosa
-        y, sr = librosa.load(audio_path, sr=self.sample_rate)
+        # Decode (soundfile where possible) and resample
+        y, sr = read_audio(audio_path, sr=self.sample_rate)
         
         # Normalize audio
         y = librosa.util.normalize(y)
@@ -70,7 +164,8 @@ class AudioToMIDI:
     
     def crepe_pitch_detection(self, y, sr):
         """High-accuracy pitch detection using CREPE"""
-        if not CREPE_AVAILABLE:
+        crepe = _get_crepe()
+        if crepe is None:
             return None, None, None
             
         print("🧠 Running CREPE pitch detection...")
@@ -79,7 +174,7 @@ class AudioToMIDI:
         # CREPE prediction with high quality settings
         time_axis, frequency, confidence, activation = crepe.predict(
             y, sr,
-            model_capacity='large',  # Best accuracy
+            model_capacity=CREPE_MODEL_CAPACITY,
             viterbi=True,           # Smooth pitch tracking
             step_size=10,           # High time resolution (10ms)
             verbose=0
@@ -92,26 +187,46 @@ class AudioToMIDI:
         
         return time_axis, frequency, confidence
     
-    def librosa_pitch_detection(self, y, sr):
-        """Pitch detection and onset analysis using librosa"""
-        print("🔬 Running Librosa pitch analysis...")
+    def librosa_pitch_detection(self, y, sr, track_pitch=True):
+        """
+        Pitch detection and onset analysis using librosa
+        
+        Args:
+            y: Audio signal
+            sr: Sample rate
+            track_pitch: Run HPSS + pyin pitch tracking; when False (CREPE
+                supplies the pitch) only onsets and RMS are computed and the
+                pitch fields are returned as None
+        """
+        print(f"🔬 Running Librosa {'pitch' if track_pitch else 'onset'} analysis...")
         start_time = time.time()
         
-        # Harmonic-percussive separation for cleaner pitch detection
-        y_harmonic, y_percussive = librosa.effects.hpss(y, margin=3.0)
+        # One STFT serves both harmonic-percussive separation and onset detection
+        stft = librosa.stft(y, hop_length=self.hop_length)
         
-        # Pitch tracking with pyin
-        f0_pyin, voiced_flag, voiced_prob = librosa.pyin(
-            y_harmonic,
-            fmin=librosa.note_to_hz('C1'),   # Wide frequency range
-            fmax=librosa.note_to_hz('C8'),
-            hop_length=self.hop_length,
-            resolution=0.1                   # Fine pitch resolution
-        )
+        f0_pyin = voiced_prob = None
+        if track_pitch:
+            # Harmonic-percussive separation for cleaner pitch detection
+            # (only the harmonic part is used, so only it is resynthesized)
+            stft_harmonic, _ = librosa.decompose.hpss(stft, margin=3.0)
+            y_harmonic = librosa.istft(stft_harmonic, hop_length=self.hop_length,
+                                       length=len(y), dtype=y.dtype)
+            
+            # Pitch tracking with pyin
+            f0_pyin, voiced_flag, voiced_prob = librosa.pyin(
+                y_harmonic,
+                fmin=PYIN_FMIN,                  # Wide frequency range
+                fmax=PYIN_FMAX,
+                hop_length=self.hop_length,
+                resolution=0.1                   # Fine pitch resolution
+            )
         
-        # Onset detection for note timing
+        # Onset detection for note timing (the log-mel onset envelope
+        # onset_detect would otherwise build from y with a second STFT)
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=np.abs(stft) ** 2, sr=sr))
+        onset_envelope = librosa.onset.onset_strength(S=mel_db, sr=sr, hop_length=self.hop_length)
         onset_frames = librosa.onset.onset_detect(
-            y=y, sr=sr,
+            onset_envelope=onset_envelope, sr=sr,
             hop_length=self.hop_length,
             units='time',
             backtrack=True,
@@ -124,7 +239,8 @@ class AudioToMIDI:
         duration = time.time() - start_time
         print(f"   Librosa analysis: {duration:.1f}s")
         print(f"   Detected {len(onset_frames)} onsets")
-        print(f"   Pitch frames: {len(f0_pyin)}")
+        if track_pitch:
+            print(f"   Pitch frames: {len(f0_pyin)}")
         
         return f0_pyin, voiced_prob, onset_frames, rms
     
@@ -132,8 +248,6 @@ class AudioToMIDI:
         """Generate MIDI notes from pitch detection data"""
         print("🎼 Generating MIDI notes...")
         
-        notes = []
-        
         # Choose primary pitch source
         if crepe_data and crepe_data[0] is not None:
             # Use CREPE as primary (higher accuracy)
@@ -158,138 +272,133 @@ class AudioToMIDI:
         
         print(f"   Processing {len(time_frames)} time frames...")
         
-        # Generate notes from pitch data
-        for i, (time_point, freq_hz, confidence) in enumerate(
-            zip(time_frames, frequencies, confidences)
-        ):
-            # Skip low confidence or invalid pitches
-            if confidence < self.confidence_threshold or np.isnan(freq_hz) or freq_hz <= 0:
-                continue
-            
-            # Convert to MIDI pitch
-            try:
-                midi_pitch = librosa.hz_to_midi(freq_hz)
-                if midi_pitch < 21 or midi_pitch > 108:  # Piano range
-                    continue
-            except:
-                continue
-            
-            # Calculate velocity from energy (if available)
-            if rms_energy is not None and rms_energy.shape[1] > 0:
-                frame_idx = min(i, rms_energy.shape[1] - 1)
-                energy = rms_energy[0, frame_idx]
-                velocity = int(np.clip(energy * 127 * 2, 30, 127))
-            else:
-                velocity = int(confidence * 127)
-            
-            # Find note duration using onsets
-            next_onset = None
-            for onset in onset_times:
-                if onset > time_point + 0.05:  # Small buffer
-                    next_onset = onset
-                    break
-            
-            if next_onset is not None:
-                duration = min(next_onset - time_point, self.max_note_duration)
-            else:
-                duration = 0.5  # Default duration
-            
-            duration = max(duration, self.min_note_duration)
-            
-            # Create note
-            note = {
-                'pitch': int(round(midi_pitch)),
-                'start': time_point,
-                'end': time_point + duration,
-                'velocity': velocity,
-                'confidence': confidence
-            }
-            notes.append(note)
-        
-        print(f"   Generated {len(notes)} raw notes")
+        # Keep confident frames whose pitch falls in the piano range
+        # (NaN frequencies fail the > 0 test). Frequencies only need single
+        # precision; confidences keep theirs since clean_notes compares them
+        # to break ties, and frame times stay float64 for the onset arithmetic
+        time_frames = np.asarray(time_frames)
+        frequencies = np.asarray(frequencies, dtype=np.float32)
+        confidences = np.asarray(confidences)
+        valid = (confidences >= self.confidence_threshold) & (frequencies > 0)
+        midi_pitches = np.full(len(frequencies), np.nan, dtype=np.float32)
+        midi_pitches[valid] = hz_to_midi(frequencies[valid])
+        valid &= (midi_pitches >= 21) & (midi_pitches <= 108)  # Piano range
+        idx = np.flatnonzero(valid)
+        
+        # Calculate velocity from energy (if available)
+        if rms_energy is not None and rms_energy.shape[1] > 0:
+            energy = rms_energy[0, np.minimum(idx, rms_energy.shape[1] - 1)]
+            velocities = np.clip(energy * 127 * 2, 30, 127).astype(np.uint8)
+        else:
+            velocities = (confidences[idx] * 127).astype(np.uint8)
+        
+        # Find note duration using onsets: the first onset after each frame
+        # (plus a small buffer) ends the note, otherwise use a default duration
+        starts = time_frames[idx]
+        onset_times = np.asarray(onset_times, dtype=float)
+        next_idx = np.searchsorted(onset_times, starts + 0.05, side='right')
+        has_next = next_idx < len(onset_times)
+        durations = np.full(len(starts), 0.5)  # Default duration
+        durations[has_next] = np.minimum(onset_times[next_idx[has_next]] - starts[has_next],
+                                         self.max_note_duration)
+        durations = np.maximum(durations, self.min_note_duration)
+        
+        # Notes are kept as parallel arrays (one entry per note); MIDI
+        # pitches and velocities fit in a byte
+        notes = {
+            'pitches': np.rint(midi_pitches[idx]).astype(np.int8),
+            'starts': starts,
+            'ends': starts + durations,
+            'velocities': velocities,
+            'confidences': confidences[idx]
+        }
+        
+        print(f"   Generated {len(starts)} raw notes")
         return notes
     
     def clean_notes(self, notes):
-        """Clean up notes by removing duplicates and merging overlaps"""
+        """
+        Clean up notes by removing duplicates and merging overlaps
+        
+        Args:
+            notes: Dict of parallel note arrays as returned by generate_notes
+            
+        Returns:
+            dict: Cleaned note arrays, sorted by start time
+        """
         print("🧹 Cleaning notes...")
         
-        if not notes:
+        total_notes = len(notes['starts'])
+        if total_notes == 0:
             return notes
         
         # Sort by start time
-        notes.sort(key=lambda x: x['start'])
-        
-        # Remove overlapping duplicates (same pitch, similar timing)
-        cleaned_notes = []
-        for note in notes:
-            is_duplicate = False
-            for existing in cleaned_notes:
-                if (abs(existing['start'] - note['start']) < 0.1 and
-                    abs(existing['pitch'] - note['pitch']) < 1):
-                    # Keep the one with higher confidence
-                    if note['confidence'] > existing['confidence']:
-                        cleaned_notes.remove(existing)
-                        break
-                    else:
-                        is_duplicate = True
-                        break
-            
-            if not is_duplicate:
-                cleaned_notes.append(note)
-        
-        # Merge very close notes of same pitch
-        merged_notes = []
-        i = 0
-        while i < len(cleaned_notes):
-            current = cleaned_notes[i]
-            
-            # Look for mergeable notes
-            while (i + 1 < len(cleaned_notes) and
-                   cleaned_notes[i + 1]['pitch'] == current['pitch'] and
-                   cleaned_notes[i + 1]['start'] - current['end'] < 0.1):
-                next_note = cleaned_notes[i + 1]
-                # Merge notes
-                current['end'] = max(current['end'], next_note['end'])
-                current['velocity'] = max(current['velocity'], next_note['velocity'])
-                i += 1
-            
-            merged_notes.append(current)
-            i += 1
-        
-        print(f"   Cleaned: {len(notes)} → {len(merged_notes)} notes")
+        order = np.argsort(notes['starts'], kind='stable')
+        notes = {field: values[order] for field, values in notes.items()}
+        pitches = notes['pitches']
+        starts = notes['starts']
+        
+        # Remove overlapping duplicates (same pitch, similar timing). Kept notes
+        # of one pitch always end up at least 0.1s apart, so each note only
+        # needs comparing with the latest kept note of its pitch
+        start_list = starts.tolist()
+        confidence_list = notes['confidences'].tolist()
+        keep = np.ones(total_notes, dtype=bool)
+        last_by_pitch = {}
+        for i, pitch in enumerate(pitches.tolist()):
+            j = last_by_pitch.get(pitch)
+            if j is not None and abs(start_list[j] - start_list[i]) < 0.1:
+                # Keep the one with higher confidence
+                if confidence_list[i] > confidence_list[j]:
+                    keep[j] = False
+                else:
+                    keep[i] = False
+                    continue
+            last_by_pitch[pitch] = i
+        
+        notes = {field: values[keep] for field, values in notes.items()}
+        pitches = notes['pitches']
+        starts = notes['starts']
+        ends = notes['ends']
+        
+        # Merge very close notes of same pitch: a note joins the previous one
+        # when it has the same pitch and starts less than 0.1s after the
+        # furthest end so far in that run of equal pitches. A note that starts
+        # a new group ends after everything before it, so the running maximum
+        # only resets between runs; ranking the ends keeps that maximum exact
+        count = len(starts)
+        same_pitch = pitches[1:] == pitches[:-1]
+        run_id = np.concatenate(([0], np.cumsum(~same_pitch)))
+        end_order = np.argsort(ends, kind='stable')
+        end_rank = np.empty(count, dtype=np.int64)
+        end_rank[end_order] = np.arange(count)
+        running_max = np.maximum.accumulate(run_id * count + end_rank)
+        furthest_end = ends[end_order[running_max % count]]
+        joins = same_pitch & (starts[1:] - furthest_end[:-1] < 0.1)
+        group_starts = np.flatnonzero(np.concatenate(([True], ~joins)))
+        
+        merged_notes = {field: values[group_starts] for field, values in notes.items()}
+        merged_notes['ends'] = np.maximum.reduceat(ends, group_starts)
+        merged_notes['velocities'] = np.maximum.reduceat(notes['velocities'], group_starts)
+        
+        print(f"   Cleaned: {total_notes} → {len(group_starts)} notes")
         return merged_notes
     
     def create_midi(self, notes, output_path):
         """Create MIDI file from notes"""
         print(f"💾 Creating MIDI file: {Path(output_path).name}")
         
-        # Create MIDI object
-        midi = pretty_midi.PrettyMIDI()
-        
-        # Create instrument (program 0 = acoustic grand piano)
-        instrument = pretty_midi.Instrument(program=0, name="Audio Transcription")
-        
-        # Add notes to instrument
-        for note_data in notes:
-            note = pretty_midi.Note(
-                velocity=note_data['velocity'],
-                pitch=note_data['pitch'],
-                start=note_data['start'],
-                end=note_data['end']
-            )
-            instrument.notes.append(note)
-        
-        midi.instruments.append(instrument)
-        
-        # Write MIDI file
-        midi.write(str(output_path))
+        # Write the notes straight to a type 0 file (program 0 = acoustic grand piano)
+        write_midi_file(output_path, notes['pitches'], notes['starts'],
+                        notes['ends'], notes['velocities'])
         
         # Summary
-        total_duration = midi.get_end_time()
-        note_density = len(notes) / total_duration if total_duration > 0 else 0
+        note_count = len(notes['pitches'])
+        total_duration = float(notes['ends'].max()) if note_count else 0.0
+        note_density = note_count / total_duration if total_duration > 0 else 0
         
         print(f"   ✅ MIDI created successfully!")
-        print(f"   📊 Total notes: {len(notes)}")
+        print(f"   📊 Total notes: {note_count}")
         print(f"   ⏱️  Duration: {total_duration:.2f}s")
         print(f"   🎵 Note density: {note_density:.1f} notes/second")
         
@@ -312,7 +421,10 @@ class AudioToMIDI:
         
         # Pitch detection
         crepe_data = self.crepe_pitch_detection(y, sr) if CREPE_AVAILABLE else None
-        librosa_data = self.librosa_pitch_detection(y, sr)
+        # pyin is only needed when CREPE did not supply the pitch (not
+        # installed, or its import failed)
+        crepe_primary = bool(crepe_data) and crepe_data[0] is not None
+        librosa_data = self.librosa_pitch_detection(y, sr, track_pitch=not crepe_primary)
         
         # Generate notes
         notes = self.generate_notes(crepe_data, librosa_data, sr)